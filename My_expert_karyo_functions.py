@@ -1,6 +1,131 @@
+import hashlib
+import os
 import re
-from collections import Counter
-import pandas as pd
+from array import array
+import threading
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from karyo_cache import CachePersistant
+from karyo_instrumentation import INSTRUMENTATION, horloge
+import karyo_regles
+from karyo_regles import Contexte, SCHEMAS_REFERENCE, schemas_enregistres
+
+# Segments "mot-clé(chromosomes)(points de cassure)" d'une anomalie ISCN.
+# Un seul balayage par anomalie suffit à alimenter tous les prédicats.
+_SEGMENT_RE = re.compile(
+    r'(ider|idic|der|dic|del|dup|ins|inv|trp|add|hsr|t|i|r)'
+    r'\(([0-9;]*)(?:(\))(?:\(([^()]*)\))?)?'
+)
+# Mots-clés dont les chromosomes sont retenus par get_chromosomes
+_CHROMOSOME_KW = frozenset(
+    ('der', 'dic', 'del', 'dup', 'ins', 't', 'i', 'ider', 'idic', 'r', 'hsr')
+)
+_OPERATEUR_RE = re.compile(r'[a-z]*')
+_BALANCED_T_RE = re.compile(r'^t\(\d+(?:;\d+)+\)\(.+\)$')
+_BALANCED_INS_RE = re.compile(r'^ins\(\d+(?:;\d+)+\)\(.+\)$')
+_CONSTITUTIONNELLE_RE = re.compile(r'^\+\d+c$')
+_PAIRE_T_RE = re.compile(r'^\d+;\d+$')
+
+
+class Anomalie:
+    """
+    Représentation typée d'une anomalie ISCN, construite en une seule passe.
+
+    - operateur : '+', '-' ou mot-clé de tête (der, dic, t, ins, del, dup,
+      i, ider, idic, r, trp...)
+    - segments : tuples (mot-clé, chromosomes, fermé, points de cassure)
+    - chromosomes : chromosomes impliqués (cf. get_chromosomes)
+    - drapeaux : incertaine ('?'), constitutionnelle (+Nc), approx ('~')
+    Les résultats des prédicats sont précalculés sur la forme normalisée.
+    """
+    __slots__ = (
+        'texte', 'norm', 'operateur', 'segments', 'chromosomes', 'numero',
+        'incertaine', 'constitutionnelle', 'approx', 'explicite',
+        'translocation_equilibree', 'insertion_equilibree',
+        'translocation_desequilibree', 'multichr_deseq', 'unichr_deseq',
+        'derive_chromosomes', 'paire_t',
+    )
+
+    def __init__(self, texte):
+        s = normalize_anomaly(texte)
+        self.texte = texte
+        self.norm = s
+
+        segments = []
+        tete = None
+        chromosomes = set()
+        for m in _SEGMENT_RE.finditer(s):
+            kw, chrs, ferme, cassures = m.groups()
+            seg = (kw, chrs, ferme is not None, cassures)
+            if m.start() == 0:
+                tete = seg
+            segments.append(seg)
+            if chrs and kw in _CHROMOSOME_KW:
+                chromosomes.update(chrs.split(';'))
+        self.segments = tuple(segments)
+        self.chromosomes = frozenset(chromosomes)
+
+        if s[:1] in ('+', '-'):
+            self.operateur = s[0]
+            self.numero = ''.join(c for c in s if c.isdecimal())
+        else:
+            self.operateur = tete[0] if tete else _OPERATEUR_RE.match(s).group()
+            self.numero = ''
+
+        self.incertaine = '?' in texte
+        self.constitutionnelle = bool(_CONSTITUTIONNELLE_RE.match(s))
+        self.approx = '~' in s
+        self.explicite = 'add' in s or 'del' in s or 'dup' in s
+
+        # Translocations / insertions
+        contient_t = 't(' in s
+        self.translocation_equilibree = (
+            s.startswith('t(') and bool(_BALANCED_T_RE.match(s))
+            and 'der' not in s and '+' not in s and '-' not in s
+        )
+        self.insertion_equilibree = (
+            s.startswith('ins(') and bool(_BALANCED_INS_RE.match(s))
+            and 'der' not in s and '+' not in s and '-' not in s
+        )
+        self.translocation_desequilibree = contient_t and (
+            'der' in s or 'dic' in s or not self.translocation_equilibree
+        )
+
+        # Déséquilibres
+        self.multichr_deseq = len(self.chromosomes) > 1 and (
+            s.startswith(('der', 'dic', 'r('))
+            or ('ins(' in s and not self.insertion_equilibree)
+            or (contient_t and not self.translocation_equilibree)
+        )
+        self.unichr_deseq = s.startswith(('trp', 'ider'))
+
+        # Dérivé/dicentrique de tête et translocation à deux chromosomes associée
+        self.derive_chromosomes = None
+        self.paire_t = None
+        if tete and tete[0] in ('der', 'dic') and tete[1] and tete[2]:
+            self.derive_chromosomes = tuple(tete[1].split(';'))
+            if len(self.derive_chromosomes) == 1:
+                for kw, chrs, ferme, _ in segments[1:]:
+                    if kw == 't' and ferme and _PAIRE_T_RE.match(chrs):
+                        self.paire_t = tuple(chrs.split(';'))
+
+    def __repr__(self):
+        return f"Anomalie({self.texte!r})"
+
+
+@lru_cache(maxsize=4096)
+def tokeniser_anomalie(anom):
+    """
+    Construit (et mémorise) la structure typée d'une anomalie ISCN.
+    """
+    return Anomalie(anom)
+
+
+def _anomalie(anom):
+    """Accepte indifféremment une chaîne ou une Anomalie déjà construite."""
+    if isinstance(anom, Anomalie):
+        return anom
+    return tokeniser_anomalie(anom)
 
 # Extraction des numéros de chromosome dans une anomalie ISCN
 def get_chromosomes(anom):
@@ -8,45 +133,269 @@ def get_chromosomes(anom):
     Retourne l'ensemble des chromosomes impliqués dans l'anomalie,
     basé sur les notations avant chaque parenthèse de type der, del, dup, ins, t, i, ider, idic.
     """
-    nums = set()
-    for m in re.finditer(r'(?:der|dic|del|dup|ins|t|i|ider|idic|r)\(([0-9;]+)', anom):
-        for num in m.group(1).split(';'):
-            nums.add(num)
-    return nums
+    return set(_anomalie(anom).chromosomes)
+
+# Masque des chromosomes impliqués: bit i pour CHROMOSOMES[i]
+CHROMOSOMES = tuple(str(n) for n in range(1, 23)) + ('X', 'Y')
+_BITS_CHROMOSOMES = {c: 1 << i for i, c in enumerate(CHROMOSOMES)}
+_GAIN_PERTE_RE = re.compile(r'^[+-](\d+|X|Y)c?$')
+
+
+def bits_chromosomes(chromosomes):
+    """Masque d'un ou plusieurs chromosomes ("7", ("5", "7"), "X"); les inconnus sont ignorés."""
+    if isinstance(chromosomes, str):
+        chromosomes = (chromosomes,)
+    masque = 0
+    for c in chromosomes:
+        masque |= _BITS_CHROMOSOMES.get(str(c), 0)
+    return masque
+
+
+def masque_chromosomes(anom):
+    """
+    Masque des chromosomes de l'anomalie (cf. CHROMOSOMES): chromosomes
+    de get_chromosomes et des autres segments (inv, add, trp), et
+    chromosome gagné ou perdu (+8, -X, +21c).
+    """
+    tok = _anomalie(anom)
+    masque = 0
+    for _, chrs, _, _ in tok.segments:
+        if chrs:
+            masque |= bits_chromosomes(chrs.split(';'))
+    if tok.operateur in ('+', '-'):
+        m = _GAIN_PERTE_RE.match(tok.norm)
+        if m:
+            masque |= _BITS_CHROMOSOMES.get(m.group(1), 0)
+    return masque
+
+def normaliser_formule(chaine_iscn):
+    """Supprime tous les blancs d'une formule ISCN (clé de cache incluse)."""
+    return re.sub(r"\s+", "", chaine_iscn)
 
 # Parsing de la formule karyotypique
-def parse_caryotype(chaine_iscn):
+_CELLULES_RE = re.compile(r"\[(.*?)\]")
+_NOMBRE_MODAL_RE = re.compile(r"^(\d+)(?:~(\d+))?(?:<(\d+n)>)?$")
+_SEXE_RE = re.compile(r"^[XY?]+c?$")
+_SIDELINE_RE = re.compile(r"^sdl(\d*)$")
+# Nombre modal exact -> anomalie de ploidie
+_PLOIDIES = {69: 'Triploidy', 92: 'Tetraploidy'}
+
+
+class Clone:
     """
-    Parse une chaîne ISCN avec clones séparés par '/'.
-    Renvoie la liste plate des anomalies et un dict {anom: [clones]}.
-    Gère aussi les anomalies de ploidie (≠46).
+    Clone d'un caryotype (partie de la formule entre deux '/').
+
+    - numero : rang du clone dans la formule (1 = premier)
+    - modal, modal_max : nombre de chromosomes (intervalle "47~49"), ou None
+    - ploidie : niveau de ploidie noté ("2n" pour "60<2n>"), ou None
+    - sexe : chromosomes sexuels ("XY", "X", "XXYY"...), hérités de la
+      lignée souche pour "idem"/"sl"/"sdl"; None s'ils ne sont pas notés
+    - cellules : nombre de cellules ("[20]", "[cp5]"), ou None
+    - composite : caryotype composite ("[cp5]")
+    - anomalies : positions des anomalies propres au clone dans la liste
+      plate du caryotype (Caryotype.anomalies)
+    - parent : numero du clone dont il dérive ("idem", "sl", "sdl"), ou None
+    """
+    __slots__ = (
+        'numero', 'modal', 'modal_max', 'ploidie', 'sexe', 'cellules',
+        'composite', 'anomalies', 'parent',
+    )
+
+    def __init__(self, numero):
+        self.numero = numero
+        self.modal = self.modal_max = self.ploidie = None
+        self.sexe = None
+        self.cellules = None
+        self.composite = False
+        self.anomalies = array('i')
+        self.parent = None
+
+    @property
+    def normal(self):
+        """Clone sans anomalie propre ni lignée souche (ex. 46,XX[20])."""
+        return not self.anomalies and self.parent is None
+
+    def __repr__(self):
+        return f"Clone({self.numero}, modal={self.modal}, cellules={self.cellules})"
+
+
+class Caryotype:
+    """
+    Formule parsée en une seule passe.
+
+    - anomalies : liste plate des anomalies (ordre de la formule)
+    - clone_map : {anomalie: ["cloneN", ...]}
+    - clones : Clone de chaque partie de la formule
+    """
+    __slots__ = ('anomalies', 'clone_map', 'clones')
+
+    def __init__(self):
+        self.anomalies = []
+        self.clone_map = {}
+        self.clones = []
+
+    def clone(self, numero):
+        return self.clones[numero - 1]
+
+    def lignee(self, numero):
+        """Clones de la lignée de ``numero``, de la lignée souche au clone."""
+        lignee = []
+        clone = self.clone(numero)
+        while clone is not None:
+            lignee.append(clone)
+            clone = self.clone(clone.parent) if clone.parent is not None else None
+        return lignee[::-1]
+
+    def anomalies_clone(self, numero):
+        """Positions de toutes les anomalies du clone, héritées comprises."""
+        positions = []
+        for clone in self.lignee(numero):
+            positions.extend(clone.anomalies)
+        return positions
+
+    def nb_cellules(self):
+        """Nombre total de cellules notées (clones sans comptage ignorés)."""
+        return sum(c.cellules for c in self.clones if c.cellules is not None)
+
+    def charge_clonale(self):
+        """Proportion de cellules anormales, ou None sans comptage de cellules."""
+        total = self.nb_cellules()
+        if not total:
+            return None
+        return sum(c.cellules for c in self.clones if c.cellules is not None and not c.normal) / total
+
+
+def _lignee_souche(clones):
+    """Dernière lignée souche (clone anormal ne dérivant d'aucun autre)."""
+    for clone in reversed(clones):
+        if clone.parent is None and clone.anomalies:
+            return clone.numero
+    return clones[0].numero if clones else None
+
+
+def _parent_sideline(clones, rang):
+    """Clone désigné par "sdl" (dernière lignée secondaire) ou "sdlN"."""
+    sidelines = [c.numero for c in clones if c.parent is not None]
+    if rang:
+        rang = int(rang)
+        return sidelines[rang - 1] if rang <= len(sidelines) else None
+    return sidelines[-1] if sidelines else None
+
+
+def parser_caryotype(chaine_iscn):
+    """
+    Parse une chaîne ISCN avec clones séparés par '/' et renvoie un
+    Caryotype: anomalies, clone_map et description de chaque clone
+    (nombre modal, chromosomes sexuels, nombre de cellules, anomalies,
+    lignée souche / lignées secondaires).
+    Les nombres modaux 69 et 92 ajoutent une anomalie de ploidie.
     """
     # Remove all whitespace for robust parsing
-    chaine_iscn = re.sub(r"\s+", "", chaine_iscn)
-    
-    anomalies = []
-    clone_map = {}
-    clones = [re.sub(r"\[.*?\]", "", c) for c in chaine_iscn.split('/')]
-    for idx, clone in enumerate(clones, start=1):
-        parts = [p.strip().strip('.') for p in clone.split(',') if p.strip()]
-        # Détection de la ploidie
-        try:
-            total = int(re.sub(r"\D", "", parts[0]))
-            if total != 46:
-                if total == 92:
-                    pl = 'Tetraploidy'
-                elif total == 69:
-                    pl = 'Triploidy'
+    chaine_iscn = normaliser_formule(chaine_iscn)
+
+    caryotype = Caryotype()
+    anomalies = caryotype.anomalies
+    clone_map = caryotype.clone_map
+    clones = caryotype.clones
+    for idx, texte in enumerate(chaine_iscn.split('/'), start=1):
+        clone = Clone(idx)
+        # Nombre de cellules (cas courant: un seul "[n]" en fin de clone)
+        if '[' in texte:
+            m = _CELLULES_RE.search(texte)
+            if m:
+                cellules = m.group(1)
+                clone.composite = cellules.startswith('cp')
+                chiffres = cellules[2:] if clone.composite else cellules
+                if chiffres.isdecimal():
+                    clone.cellules = int(chiffres)
+                if m.end() == len(texte) and texte.count('[') == 1:
+                    texte = texte[:m.start()]
+                else:
+                    texte = _CELLULES_RE.sub("", texte)
+        parts = [p.strip().strip('.') for p in texte.split(',') if p.strip()]
 
+        # Nombre modal et ploidie
+        if parts and parts[0].isdecimal():
+            clone.modal = int(parts[0])
+        elif parts:
+            m = _NOMBRE_MODAL_RE.match(parts[0])
+            if m:
+                clone.modal = int(m.group(1))
+                clone.modal_max = int(m.group(2)) if m.group(2) else None
+                clone.ploidie = m.group(3)
+        if clone.modal is not None and clone.modal_max is None:
+            pl = _PLOIDIES.get(clone.modal)
+            if pl is not None:
+                clone.anomalies.append(len(anomalies))
                 anomalies.append(pl)
                 clone_map.setdefault(pl, []).append(f"clone{idx}")
-        except Exception:
-            pass
+
+        # Chromosomes sexuels, ou renvoi à une lignée ("idem", "sl", "sdl")
+        if len(parts) > 1:
+            sexe = parts[1]
+            if sexe in ('idem', 'sl'):
+                clone.parent = _lignee_souche(clones)
+            elif _SIDELINE_RE.match(sexe):
+                clone.parent = _parent_sideline(clones, sexe[3:])
+            elif _SEXE_RE.match(sexe):
+                clone.sexe = sexe
+            if clone.parent is not None:
+                clone.sexe = clones[clone.parent - 1].sexe
+
         # Extraction des anomalies structurelles
         for an in parts[2:]:
+            clone.anomalies.append(len(anomalies))
             anomalies.append(an)
             clone_map.setdefault(an, []).append(f"clone{idx}")
-    return anomalies, clone_map
+        clones.append(clone)
+    return caryotype
+
+
+def parse_caryotype(chaine_iscn):
+    """
+    Parse une chaîne ISCN avec clones séparés par '/'.
+    Renvoie la liste plate des anomalies et un dict {anom: [clones]}.
+    Gère aussi les anomalies de ploidie (cf. parser_caryotype).
+    """
+    caryotype = parser_caryotype(chaine_iscn)
+    return caryotype.anomalies, caryotype.clone_map
+
+
+def _anomalies_clone(texte):
+    """
+    Anomalies d'une partie de formule déjà normalisée (entre deux '/'),
+    découpée comme dans parser_caryotype mais sans décrire le clone:
+    anomalie de ploidie éventuelle, puis anomalies structurelles.
+    """
+    if '[' in texte:
+        m = _CELLULES_RE.search(texte)
+        if m:
+            if m.end() == len(texte) and texte.count('[') == 1:
+                texte = texte[:m.start()]
+            else:
+                texte = _CELLULES_RE.sub("", texte)
+    parts = [p.strip().strip('.') for p in texte.split(',') if p.strip()]
+    if not parts:
+        return parts
+    if parts[0].isdecimal():
+        pl = _PLOIDIES.get(int(parts[0]))
+    else:
+        m = _NOMBRE_MODAL_RE.match(parts[0])
+        pl = _PLOIDIES.get(int(m.group(1))) if m and not m.group(2) else None
+    del parts[:2]
+    if pl is not None:
+        parts.insert(0, pl)
+    return parts
+
+
+
+def tokeniser_caryotype(chaine_iscn):
+    """
+    Comme parse_caryotype, mais renvoie directement les anomalies sous
+    forme de structures Anomalie (une seule tokenisation par anomalie).
+    """
+    anomalies, clone_map = parse_caryotype(chaine_iscn)
+    return [tokeniser_anomalie(a) for a in anomalies], clone_map
 
 # Détection des anomalies unichromosomiques déséquilibrées de poids 2
 def is_single_chr_deseq(anom, count):
@@ -55,15 +404,12 @@ def is_single_chr_deseq(anom, count):
     - Tetrasomie/triplication/quadruplication
     - Chromosome isodérivé
     """
-    # Tetrasomie/triplication/quadruplication
-    if anom.startswith('+') and count > 1:
+    tok = _anomalie(anom)
+    # Tetrasomie (gain répété) ; triplication/quadruplication et isodérivé
+    # sont précalculés lors de la tokenisation
+    if tok.operateur == '+' and count > 1:
         return True
-    if anom.startswith('trp'):
-        return True
-    # Chromosome isodérivé ou isodicentrique
-    if anom.startswith('ider'):
-        return True
-    return False
+    return tok.unichr_deseq
 
 # Détection des anomalies équilibrées
 def is_balanced_translocation(anom):
@@ -71,8 +417,7 @@ def is_balanced_translocation(anom):
     Détecte les translocations équilibrées:
     t(NUM;NUM[;...])(p;q) sans der,+,-
     """
-    pattern = r'^t\(\d+(?:;\d+)+\)\(.+\)$'
-    return bool(re.match(pattern, anom)) and 'der' not in anom and '+' not in anom and '-' not in anom
+    return _anomalie(anom).translocation_equilibree
 
 def is_unbalanced_translocation(anom):
     """
@@ -80,21 +425,14 @@ def is_unbalanced_translocation(anom):
     - chromosome dérivé (der(...)) contenant un t(...) ou
     - tout t(...) non pure
     """
-    # Cas d'un chromosome dérivé ou dicentrique comportant une translocation
-    if ('der' in anom or 'dic' in anom) and 't(' in anom:
-        return True
-    # Cas d'un t(...) quelconque non pur (équilibré)
-    if 't(' in anom and not is_balanced_translocation(anom):
-        return True
-    return False
+    return _anomalie(anom).translocation_desequilibree
 
 def is_balanced_insertion(anom):
     """
     Détecte les insertions équilibrées:
     ins(NUM;NUM[;...])(p;q1q2) sans der,+,-
     """
-    pattern = r'^ins\(\d+(?:;\d+)+\)\(.+\)$'
-    return bool(re.match(pattern, anom)) and 'der' not in anom and '+' not in anom and '-' not in anom
+    return _anomalie(anom).insertion_equilibree
 
 # Détection des anomalies multichromosomiques déséquilibrées pour 2 points
 def is_complex_multichr_deseq(anom):
@@ -102,20 +440,7 @@ def is_complex_multichr_deseq(anom):
     Détecte les anomalies multichromosomiques déséquilibrées (≥2 chromosomes) pour 2 points.
     Renvoie False si un seul chromosome impliqué.
     """
-    chroms = get_chromosomes(anom)
-    # si un seul chromosome impliqué -> pas multi-chromosomique déséquilibrée
-    if len(chroms) <= 1:
-        return False
-    # dérivé, chromosome dicentrique ou anneau -> complexe multi-chromosomique
-    if anom.startswith('der') or anom.startswith('dic') or anom.startswith('r('):
-        return True
-    # insertion non pure -> complexe
-    if 'ins(' in anom and not is_balanced_insertion(anom):
-        return True
-    # translocation non pure -> complexe
-    if 't(' in anom and not is_balanced_translocation(anom):
-        return True
-    return False
+    return _anomalie(anom).multichr_deseq
 
 # Typage pour affichage
 def type_anomalie(anom):
@@ -123,17 +448,19 @@ def type_anomalie(anom):
     Détermine le type d'anomalie pour l'affichage.
     Retourne une chaîne décrivant le type d'anomalie.
     """
-    if is_complex_multichr_deseq(anom):
+    tok = _anomalie(anom)
+    anom = tok.norm
+    if tok.multichr_deseq:
         return 'Multichromosomique déséquilibrée'
-    if is_balanced_translocation(anom):
+    if tok.translocation_equilibree:
         return 'Translocation équilibrée'
-    if is_unbalanced_translocation(anom):
+    if tok.translocation_desequilibree:
         return 'Translocation déséquilibrée'
-    if is_balanced_insertion(anom):
+    if tok.insertion_equilibree:
         return 'Insertion équilibrée'
     if anom == '<2n>':
         return 'Ploidy'
-    if '~' in anom:
+    if tok.approx:
         return 'Pléiade chromosomique'
     if anom == '+mar':
         return 'Chromosome marqueur'
@@ -149,10 +476,10 @@ def type_anomalie(anom):
         return 'Insertion'
     if anom.startswith('t('):
         return 'Translocation'
-    if anom.startswith('+'):
-        return 'Gain chr' + re.sub(r"\D", "", anom)
-    if anom.startswith('-'):
-        return 'Perte chr' + re.sub(r"\D", "", anom)
+    if tok.operateur == '+':
+        return 'Gain chr' + tok.numero
+    if tok.operateur == '-':
+        return 'Perte chr' + tok.numero
     if anom.startswith('dup'):
         return 'Duplication'
     if anom.startswith('del'):
@@ -180,58 +507,110 @@ def normalize_anomaly(anom: str) -> str:
     return norm
 
 
+class IndexCaryotype:
+    """
+    Index des anomalies distinctes d'un caryotype, construits en une seule
+    passe (cf. ajouter):
+
+    - anomalies : {anomalie normalisée: Anomalie} (première occurrence)
+    - par_chromosome : {chromosome: [anomalies normalisées]}, chromosomes
+      impliqués (get_chromosomes) et numéro des gains/pertes
+    - derives_par_paire : {(chr, chr): [dérivés]} dérivés d'une
+      translocation à deux chromosomes
+    - derives_multi : {chromosome: [dérivés]} dérivés/dicentriques
+      multi-chromosomiques
+    """
+    __slots__ = ('anomalies', 'par_chromosome', 'derives_par_paire', 'derives_multi')
+
+    def __init__(self, anomalies=()):
+        self.anomalies = {}
+        self.par_chromosome = {}
+        self.derives_par_paire = {}
+        self.derives_multi = {}
+        for a in anomalies:
+            self.ajouter(a)
+
+    def ajouter(self, anom):
+        """Indexe une anomalie (chaîne ou Anomalie); les doublons sont ignorés."""
+        tok = _anomalie(anom)
+        norm = tok.norm
+        if norm in self.anomalies:
+            return tok
+        self.anomalies[norm] = tok
+
+        par_chromosome = self.par_chromosome
+        for c in tok.chromosomes:
+            par_chromosome.setdefault(c, []).append(norm)
+        if tok.operateur in ('+', '-') and tok.numero not in tok.chromosomes:
+            par_chromosome.setdefault(tok.numero, []).append(norm)
+
+        if tok.paire_t:
+            self.derives_par_paire.setdefault(tuple(sorted(tok.paire_t)), []).append(norm)
+        chrs = tok.derive_chromosomes
+        if chrs and len(chrs) > 1:
+            for c in chrs:
+                self.derives_multi.setdefault(c, []).append(norm)
+        return tok
+
+    def implicites(self):
+        """Anomalies implicites du caryotype (cf. detect_implicit_anomalies)."""
+        anomalies = self.anomalies
+        implicit = {}
+
+        # 1) Dérivés implicites s'il existe une version explicite (add/del/dup)
+        for ders in self.derives_par_paire.values():
+            explicits = [d for d in ders if anomalies[d].explicite]
+            if explicits:
+                ref = anomalies[explicits[0]].texte
+                for d in ders:
+                    if not anomalies[d].explicite:
+                        implicit[d] = {"reason": "Dérivé implicite", "ref": ref}
+
+        # 2) Gains/pertes simples issus d'un dérivé multi-chromosomique
+        for c, ders in self.derives_multi.items():
+            for an in self.par_chromosome.get(c, ()):
+                tok = anomalies[an]
+                if tok.operateur in ('+', '-') and tok.numero == c:
+                    implicit[an] = {"reason": "Gain/perte implicite", "ref": anomalies[ders[0]].texte}
+
+        return implicit
+
+
+def indexer_caryotype(chaine_iscn):
+    """
+    Comme tokeniser_caryotype, en construisant dans la même passe
+    l'IndexCaryotype de la formule.
+    Renvoie (anomalies tokenisées, clone_map, index).
+    """
+    anomalies, clone_map = parse_caryotype(chaine_iscn)
+    index = IndexCaryotype()
+    tokens = [index.ajouter(tokeniser_anomalie(a)) for a in anomalies]
+    return tokens, clone_map, index
+
+
 def detect_implicit_anomalies(anomalies):
     """Détecte les anomalies implicites et renvoie un dict.
 
     Le dict a pour clé l'anomalie normalisée et pour valeur un
     dictionnaire avec la clef ``reason`` décrivant la cause et ``ref``
     l'anomalie de référence à afficher entre parenthèses.
+    La détection se fait par consultation des index du caryotype
+    (cf. IndexCaryotype).
     """
-    norm_counts = Counter(normalize_anomaly(a) for a in anomalies)
-    # mappage normalisé -> version originale pour l'affichage
-    norm_to_orig = {}
-    for a in anomalies:
-        norm = normalize_anomaly(a)
-        norm_to_orig.setdefault(norm, a)
+    return IndexCaryotype(anomalies).implicites()
 
-    implicit = {}
 
-    # 1) Dérivés implicites s'il existe une version explicite (add/del/dup)
-    t_events = {}
-    for an in norm_counts:
-        m = re.match(r"(?:der|dic)\((\d+)\).*t\((\d+);(\d+)\)", an)
-        if m:
-            _, A, B = m.groups()
-            key = tuple(sorted([A, B]))
-            t_events.setdefault(key, []).append(an)
-    for ders in t_events.values():
-        explicits = [d for d in ders if re.search(r"add|del|dup", d)]
-        if explicits:
-            ref = norm_to_orig[explicits[0]]
-            for d in ders:
-                if d not in explicits:
-                    implicit[d] = {"reason": "Dérivé implicite", "ref": ref}
-
-    # 2) Gains/pertes simples issus d'un dérivé multi-chromosomique
-    multi_der = {}
-    for an in norm_counts:
-        if an.startswith(('der', 'dic')):
-            m = re.match(r"^(?:der|dic)\(([0-9;]+)\)", an)
-            if m:
-                chrs = m.group(1).split(';')
-                if len(chrs) > 1:
-                    for c in chrs:
-                        multi_der.setdefault(c, []).append(an)
+# Colonnes du DataFrame de résultats (une ligne par anomalie)
+COLONNES = [
+    "Anomalie", "Type", "Explication", "Occurrences", "Clones",
+    "Score Jondreville 2020", "Score ISCN 2024",
+]
 
-    for an in norm_counts:
-        if an.startswith(('+', '-')):
-            num = re.sub(r"\D", "", an)
-            if num in multi_der:
-                ref_norm = multi_der[num][0]
-                ref = norm_to_orig.get(ref_norm, ref_norm)
-                implicit[an] = {"reason": "Gain/perte implicite", "ref": ref}
-
-    return implicit
+# Enregistrement léger d'une anomalie scorée (même ordre que COLONNES)
+LigneAnomalie = namedtuple('LigneAnomalie', [
+    'anomalie', 'type', 'explication', 'occurrences', 'clones',
+    'score_jondreville', 'score_iscn',
+])
 
 
 def calcul_scores(anomalies, clone_map):
@@ -244,90 +623,676 @@ def calcul_scores(anomalies, clone_map):
       - 2 pts pour déséquilibres unichr/multichr ou translocations déséquilibrées
       - 1 pt pour anomalies standard
     """
-    counts = Counter(anomalies)
-    norm_counts = Counter(normalize_anomaly(a) for a in anomalies)
+    lignes, total_j, total_i = scorer_anomalies(anomalies, clone_map)
+    return _dataframe_formule(lignes, total_j, total_i), total_i
+
+
+def _dataframe_formule(lignes, total_j, total_i):
+    """DataFrame d'une formule, avec la ligne de totaux (pandas chargé à la demande)."""
+    from karyo_dataframe import dataframe_formule
+    with INSTRUMENTATION.mesurer("dataframe"):
+        return dataframe_formule(lignes, total_j, total_i)
+
+
+class Vocabulaire:
+    """
+    Interne les anomalies d'un lot: chaque chaîne distincte reçoit un
+    identifiant entier et n'est tokenisée et classée qu'une seule fois,
+    pour tous les schémas de scoring (cf. karyo_regles).
+    Les tableaux sont indexés par identifiant:
+    - tokens
+    - types : type d'affichage, None tant qu'il n'a pas été demandé
+      (cf. type, inutile en mode comptage seul)
+    - scores / explications : tuples (un élément par schéma) issus des
+      règles indépendantes du caryotype
+    - contextuelles : tuples (indice de schéma, règles) à réévaluer pour
+      chaque caryotype, vide si aucune
+    - implicables : l'anomalie peut rendre implicites d'autres anomalies
+    """
+    __slots__ = (
+        'schemas', 'regles_contextuelles', 'ids', 'tokens', 'types', 'scores',
+        'explications', 'contextuelles', 'implicables',
+    )
+
+    def __init__(self, supplementaires=None):
+        # Schémas de référence toujours en tête (Jondreville 2020, ISCN 2024)
+        if supplementaires is None:
+            self.schemas = schemas_enregistres()
+        else:
+            self.schemas = SCHEMAS_REFERENCE + tuple(supplementaires)
+        # Règles contextuelles de tous les schémas (préalables par caryotype)
+        self.regles_contextuelles = tuple(
+            r for schema in self.schemas for r in schema.regles if r.contextuelle
+        )
+        self.ids = {}
+        self.tokens = []
+        self.types = []
+        self.scores = []
+        self.explications = []
+        self.contextuelles = []
+        self.implicables = array('b')
 
-    implicit_info = detect_implicit_anomalies(anomalies)
+    def __len__(self):
+        return len(self.tokens)
+
+    def identifiant(self, anom):
+        """Identifiant de l'anomalie (chaîne ou Anomalie), classée au premier ajout."""
+        texte = anom.texte if isinstance(anom, Anomalie) else anom
+        i = self.ids.get(texte)
+        if i is None:
+            tok = _anomalie(anom)
+            scores = []
+            explications = []
+            contextuelles = []
+            for k, schema in enumerate(self.schemas):
+                regles, score, explication = schema.classer(tok)
+                scores.append(score)
+                explications.append(explication)
+                if regles:
+                    contextuelles.append((k, regles))
+            i = self.ids[texte] = len(self.tokens)
+            self.tokens.append(tok)
+            self.types.append(None)
+            self.scores.append(tuple(scores))
+            self.explications.append(tuple(explications))
+            self.contextuelles.append(tuple(contextuelles))
+            chrs = tok.derive_chromosomes
+            self.implicables.append(bool(tok.paire_t or (chrs and len(chrs) > 1)))
+        return i
+
+    def type(self, i):
+        """Type d'affichage de l'anomalie ``i`` (cf. type_anomalie), calculé à la demande."""
+        t = self.types[i]
+        if t is None:
+            t = self.types[i] = type_anomalie(self.tokens[i])
+        return t
+
+
+def _contexte_caryotype(anomalies, voc):
+    """
+    Prépare le parcours d'un caryotype: occurrences par identifiant,
+    contexte des règles contextuelles et règles contextuelles pouvant
+    s'appliquer à ce caryotype (cf. Regle.prealable).
+    """
+    return _contexte_identifiants(list(map(voc.identifiant, anomalies)), voc)
+
+
+def _contexte_identifiants(identifiants, voc):
+    """_contexte_caryotype pour des anomalies déjà internées dans ``voc``."""
+    # Comptages par dict (Counter est coûteux pour quelques éléments)
+    tokens = voc.tokens
+    counts = {}
+    occurrences = {}
+    for i in identifiants:
+        counts[i] = counts.get(i, 0) + 1
+        norm = tokens[i].norm
+        occurrences[norm] = occurrences.get(norm, 0) + 1
+
+    # Détection des implicites seulement si un dérivé peut en produire
+    if any(voc.implicables[i] for i in counts):
+        if INSTRUMENTATION.actif:
+            t0 = horloge()
+            implicit_info = detect_implicit_anomalies([tokens[i] for i in counts])
+            INSTRUMENTATION.ajouter("implicites", horloge() - t0)
+        else:
+            implicit_info = detect_implicit_anomalies([tokens[i] for i in counts])
+    else:
+        implicit_info = {}
+    contexte = Contexte(occurrences, len(identifiants), implicit_info)
+    actives = []
+    for regle in voc.regles_contextuelles:
+        if regle.prealable is None or regle.prealable(contexte):
+            actives.append(regle)
+    return counts, contexte, actives
+
+
+def _scores_contextuels(i, voc, contexte, actives, explications=True):
+    """
+    Scores et explications de l'anomalie ``i`` pour tous les schémas, les
+    règles contextuelles ``actives`` l'emportant sur le classement statique.
+    Sans ``explications``, seuls les scores sont calculés (explications None).
+    """
+    scores = textes = None
+    tok = voc.tokens[i]
+    for k, regles in voc.contextuelles[i]:
+        for regle in regles:
+            if regle in actives and regle.condition(tok, contexte):
+                if scores is None:
+                    scores = list(voc.scores[i])
+                    if explications:
+                        textes = list(voc.explications[i])
+                scores[k] = regle.score
+                if explications:
+                    textes[k] = regle.expliquer(tok, contexte)
+                break
+    if scores is None:
+        return voc.scores[i], voc.explications[i] if explications else None
+    return scores, textes
+
+
+def scorer_anomalies(anomalies, clone_map, vocabulaire=None):
+    """
+    Cœur du scoring, sans pandas.
+    Les anomalies sont classées via ``vocabulaire`` (partagé sur un lot);
+    seules les règles dépendantes du caryotype (anomalies implicites,
+    gains répétés) sont évaluées ici, en un seul parcours pour tous les
+    schémas.
+    Renvoie (liste de LigneAnomalie, total Jondreville 2020, total ISCN 2024).
+    """
+    voc = vocabulaire if vocabulaire is not None else Vocabulaire()
+    counts, contexte, actives = _contexte_caryotype(anomalies, voc)
+    tokens = voc.tokens
+    contextuelles = voc.contextuelles
 
     rows = []
     total_j = total_i = 0
+    for i, cnt in counts.items():
+        if actives and contextuelles[i]:
+            scores, explications = _scores_contextuels(i, voc, contexte, actives)
+        else:
+            scores, explications = voc.scores[i], voc.explications[i]
+        total_j += scores[0]
+        total_i += scores[1]
+        texte = tokens[i].texte
+        rows.append(LigneAnomalie(
+            texte,
+            voc.type(i),
+            explications[1],
+            cnt,
+            ", ".join(clone_map.get(texte, [])),
+            scores[0],
+            scores[1],
+        ))
 
-    for anom, cnt in counts.items():
-        score_j = 1  # Jondreville = 1 pour toutes
-        norm = normalize_anomaly(anom)
-        cnt_norm = norm_counts[norm]
-
-        # a) Constitutionnelles (+Nc) → ISCN = 0
-        if re.match(r"^\+\d+c$", norm):
-            score_i = 0
-            explication = "Anomalie constitutionnelle (0 point)"
-
-        # b) Anomalies détectées comme implicites
-        elif norm in implicit_info:
-            info = implicit_info[norm]
-            score_i = 0
-            explication = f"{info['reason']} ({info['ref']}) (0 point)"
-
-        # c) Gains/pertes simples (analyse standard si non implicite)
-        elif norm.startswith(("+", "-")):
-            if is_single_chr_deseq(norm, cnt_norm):
-                score_i = 2
-                explication = "Déséquilibre unichromosomique (2 points)"
-            elif is_complex_multichr_deseq(norm):
-                score_i = 2
-                explication = "Déséquilibre multichromosomique complexe (2 points)"
-            elif is_unbalanced_translocation(norm):
-                score_i = 2
-                explication = "Translocation déséquilibrée (2 points)"
-            else:
-                score_i = 1
-                explication = "Anomalie standard (1 point)"
+    return rows, total_j, total_i
 
-        # d) Chromosomes dicentriques → 2 points
-        elif norm.startswith('dic'):
-            score_i = 2
-            explication = "Chromosome dicentrique (2 points)"
 
-        # e) Toutes les autres anomalies → scoring standard
+def scorer_schemas(anomalies, clone_map, vocabulaire=None):
+    """
+    Comme scorer_anomalies, avec en plus les scores de tous les schémas
+    enregistrés (cf. karyo_regles.enregistrer_schema), calculés lors du
+    même parcours.
+    Renvoie (liste de LigneAnomalie, {schéma: scores par ligne},
+    {schéma: total}).
+    """
+    voc = vocabulaire if vocabulaire is not None else Vocabulaire()
+    counts, contexte, actives = _contexte_caryotype(anomalies, voc)
+    noms = [schema.nom for schema in voc.schemas]
+
+    rows = []
+    colonnes = [[] for _ in noms]
+    for i, cnt in counts.items():
+        if actives and voc.contextuelles[i]:
+            scores, explications = _scores_contextuels(i, voc, contexte, actives)
         else:
-            if is_single_chr_deseq(norm, cnt_norm):
-                score_i = 2
-                explication = "Déséquilibre unichromosomique (2 points)"
-            elif is_complex_multichr_deseq(norm):
-                score_i = 2
-                explication = "Déséquilibre multichromosomique complexe (2 points)"
-            elif is_unbalanced_translocation(norm):
-                score_i = 2
-                explication = "Translocation déséquilibrée (2 points)"
+            scores, explications = voc.scores[i], voc.explications[i]
+        texte = voc.tokens[i].texte
+        rows.append(LigneAnomalie(
+            texte, voc.type(i), explications[1], cnt,
+            ", ".join(clone_map.get(texte, [])), scores[0], scores[1],
+        ))
+        for colonne, score in zip(colonnes, scores):
+            colonne.append(score)
+
+    scores_par_schema = dict(zip(noms, colonnes))
+    return rows, scores_par_schema, {nom: sum(c) for nom, c in scores_par_schema.items()}
+
+
+def compter_anomalies(anomalies, vocabulaire=None):
+    """
+    Mode comptage seul: totaux du caryotype pour chaque schéma de
+    ``vocabulaire`` (tuple, dans l'ordre de vocabulaire.schemas), sans
+    lignes d'anomalies, types ni explications.
+    Mêmes totaux que scorer_anomalies / scorer_schemas.
+    """
+    voc = vocabulaire if vocabulaire is not None else Vocabulaire()
+    return _compter_identifiants(list(map(voc.identifiant, anomalies)), voc)
+
+
+def _compter_identifiants(identifiants, voc):
+    """compter_anomalies pour des anomalies déjà internées dans ``voc``."""
+    counts, contexte, actives = _contexte_identifiants(identifiants, voc)
+    scores = voc.scores
+    if actives:
+        contextuelles = voc.contextuelles
+        lignes = [
+            _scores_contextuels(i, voc, contexte, actives, False)[0] if contextuelles[i] else scores[i]
+            for i in counts
+        ]
+    else:
+        lignes = [scores[i] for i in counts]
+    if not lignes:
+        return (0,) * len(voc.schemas)
+    return tuple(map(sum, zip(*lignes)))
+
+
+class ResultatLot:
+    """
+    Résultat compact de analyser_lot.
+
+    - lignes : LigneAnomalie de toutes les formules, à plat
+    - debuts : position de la première ligne de chaque formule dans ``lignes``
+    - totaux_jondreville / totaux_iscn : totaux par formule (0 en cas d'erreur)
+    - erreurs : message d'erreur par formule, ou None
+    """
+    __slots__ = ('lignes', 'debuts', 'totaux_jondreville', 'totaux_iscn', 'erreurs')
+
+    def __init__(self):
+        self.lignes = []
+        self.debuts = array('l')
+        self.totaux_jondreville = array('l')
+        self.totaux_iscn = array('l')
+        self.erreurs = []
+
+    def __len__(self):
+        return len(self.erreurs)
+
+    def anomalies(self, i):
+        """Lignes d'anomalies de la i-ème formule."""
+        fin = self.debuts[i + 1] if i + 1 < len(self.debuts) else len(self.lignes)
+        return self.lignes[self.debuts[i]:fin]
+
+    def ajouter(self, lignes, total_j, total_i):
+        """Ajoute les résultats d'une formule."""
+        self.debuts.append(len(self.lignes))
+        self.lignes.extend(lignes)
+        self.totaux_jondreville.append(total_j)
+        self.totaux_iscn.append(total_i)
+        self.erreurs.append(None)
+
+    def ajouter_erreur(self, message):
+        """Ajoute une formule en erreur."""
+        self.debuts.append(len(self.lignes))
+        self.totaux_jondreville.append(0)
+        self.totaux_iscn.append(0)
+        self.erreurs.append(message)
+
+    def reprendre(self, autre, i):
+        """Ajoute les résultats de la i-ème formule d'un autre ResultatLot."""
+        if autre.erreurs[i] is not None:
+            self.ajouter_erreur(autre.erreurs[i])
+        else:
+            self.ajouter(autre.anomalies(i), autre.totaux_jondreville[i], autre.totaux_iscn[i])
+
+    def etendre(self, autre):
+        """Ajoute à la suite les résultats d'un autre ResultatLot."""
+        decalage = len(self.lignes)
+        self.debuts.extend(d + decalage for d in autre.debuts)
+        self.lignes.extend(autre.lignes)
+        self.totaux_jondreville.extend(autre.totaux_jondreville)
+        self.totaux_iscn.extend(autre.totaux_iscn)
+        self.erreurs.extend(autre.erreurs)
+
+    def to_dataframe(self):
+        """
+        Construit un unique DataFrame (une ligne par anomalie) avec la
+        position de la formule d'origine dans la colonne "Index formule".
+        """
+        from karyo_dataframe import dataframe_lot
+        with INSTRUMENTATION.mesurer("dataframe"):
+            return dataframe_lot(self)
+
+
+class CacheLRU:
+    """
+    Cache LRU borné, avec compteurs de hits, misses et évictions.
+    Une taille maximale de 0 désactive le cache.
+    """
+
+    def __init__(self, taille_max):
+        self.taille_max = taille_max
+        self._donnees = OrderedDict()
+        self._verrou = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def __contains__(self, cle):
+        return cle in self._donnees
+
+    def __len__(self):
+        return len(self._donnees)
+
+    def get(self, cle):
+        """Valeur associée à ``cle`` (None si absente)."""
+        with self._verrou:
+            valeur = self._donnees.get(cle)
+            if valeur is None:
+                self.misses += 1
             else:
-                score_i = 1
-                explication = "Anomalie standard (1 point)"
-
-        total_j += score_j
-        total_i += score_i
-
-        rows.append({
-            "Anomalie": anom,
-            "Type": type_anomalie(norm),
-            "Explication": explication,
-            "Occurrences": cnt,
-            "Clones": ", ".join(clone_map.get(anom, [])),
-            "Score Jondreville 2020": score_j,
-            "Score ISCN 2024": score_i,
-        })
-
-    # Ligne de totaux
-    rows.append({
-        "Anomalie": "TOTAL",
-        "Type": "",
-        "Explication": "",
-        "Occurrences": "",
-        "Clones": "",
-        "Score Jondreville 2020": total_j,
-        "Score ISCN 2024": total_i,
-    })
-
-    return pd.DataFrame(rows), total_i
+                self.hits += 1
+                self._donnees.move_to_end(cle)
+            return valeur
+
+    def compter(self, hit):
+        """Compte un accès servi hors du cache (ex. valeur calculée ailleurs)."""
+        with self._verrou:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, cle, valeur):
+        """Mémorise ``valeur``, en évinçant les entrées les moins récentes."""
+        if self.taille_max <= 0:
+            return
+        with self._verrou:
+            self._donnees[cle] = valeur
+            self._donnees.move_to_end(cle)
+            while len(self._donnees) > self.taille_max:
+                self._donnees.popitem(last=False)
+                self.evictions += 1
+
+    def vider(self):
+        """Vide le cache et remet les compteurs à zéro."""
+        with self._verrou:
+            self._donnees.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def redimensionner(self, taille_max):
+        """Change la taille maximale (évince si nécessaire)."""
+        with self._verrou:
+            self.taille_max = taille_max
+            while len(self._donnees) > max(taille_max, 0):
+                self._donnees.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """Compteurs du cache sous forme de dict."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "taille": len(self._donnees),
+            "taille_max": self.taille_max,
+            "taux_hit": self.hits / total if total else 0.0,
+        }
+
+
+# Cache des analyses, par formule normalisée (cf. normaliser_formule)
+TAILLE_CACHE_ANALYSE = 50000
+_CACHE_ANALYSE = CacheLRU(TAILLE_CACHE_ANALYSE)
+
+
+def stats_cache_analyse():
+    """Compteurs hits/misses/évictions du cache des analyses."""
+    return _CACHE_ANALYSE.stats()
+
+
+def vider_cache_analyse():
+    """Vide le cache des analyses."""
+    _CACHE_ANALYSE.vider()
+
+
+def configurer_cache_analyse(taille_max):
+    """Fixe la taille maximale du cache des analyses (0 pour le désactiver)."""
+    _CACHE_ANALYSE.redimensionner(taille_max)
+
+
+def _version_regles(base, *chemins):
+    """Étiquette de version des règles: base + empreinte des sources du moteur."""
+    h = hashlib.sha256()
+    for chemin in chemins:
+        try:
+            with open(chemin, 'rb') as f:
+                h.update(f.read())
+        except OSError:
+            return base
+    return f"{base}-{h.hexdigest()[:12]}"
+
+
+# Version des règles de scoring (clé du cache persistant): toute
+# modification du moteur invalide automatiquement les anciennes entrées
+VERSION_REGLES = _version_regles("ISCN2024-Jondreville2020", __file__, karyo_regles.__file__)
+
+# Cache persistant optionnel (cf. activer_cache_persistant)
+_CACHE_PERSISTANT = None
+
+
+def activer_cache_persistant(chemin, version=VERSION_REGLES):
+    """
+    Active le cache persistant SQLite ``chemin`` pour les analyses.
+    Renvoie l'objet CachePersistant.
+    """
+    global _CACHE_PERSISTANT
+    desactiver_cache_persistant()
+    _CACHE_PERSISTANT = CachePersistant(chemin, version)
+    return _CACHE_PERSISTANT
+
+
+def desactiver_cache_persistant():
+    """Ferme et désactive le cache persistant."""
+    global _CACHE_PERSISTANT
+    if _CACHE_PERSISTANT is not None:
+        _CACHE_PERSISTANT.fermer()
+    _CACHE_PERSISTANT = None
+
+
+def cache_persistant():
+    """Cache persistant actif et utilisable dans ce processus, ou None."""
+    if _CACHE_PERSISTANT is not None and _CACHE_PERSISTANT.actif():
+        return _CACHE_PERSISTANT
+    return None
+
+
+def _depuis_persistant(cle):
+    """Résultat du cache persistant pour ``cle`` (chargé dans le LRU), ou None."""
+    persistant = cache_persistant()
+    if persistant is None:
+        return None
+    donnees = persistant.get(cle)
+    if donnees is None:
+        return None
+    lignes, total_j, total_i = donnees
+    resultat = (tuple(LigneAnomalie(*ligne) for ligne in lignes), total_j, total_i)
+    _CACHE_ANALYSE.put(cle, resultat)
+    return resultat
+
+
+def _vers_persistant(cle, resultat):
+    persistant = cache_persistant()
+    if persistant is not None:
+        persistant.put(cle, resultat)
+
+
+def _flush_persistant():
+    persistant = cache_persistant()
+    if persistant is not None:
+        persistant.flush()
+
+
+def _analyser_normalisee(cle, vocabulaire=None):
+    """
+    Scoring d'une formule déjà normalisée, à travers le cache LRU puis,
+    s'il est activé, le cache persistant.
+    Renvoie (lignes, total Jondreville 2020, total ISCN 2024).
+    """
+    mesure = INSTRUMENTATION.actif
+    if mesure:
+        t0 = horloge()
+    resultat = _CACHE_ANALYSE.get(cle)
+    if resultat is None:
+        resultat = _depuis_persistant(cle)
+    if mesure:
+        t1 = horloge()
+        INSTRUMENTATION.ajouter("cache", t1 - t0)
+    if resultat is None:
+        anomalies, clone_map = parse_caryotype(cle)
+        if mesure:
+            t2 = horloge()
+        lignes, total_j, total_i = scorer_anomalies(anomalies, clone_map, vocabulaire)
+        resultat = (tuple(lignes), total_j, total_i)
+        if mesure:
+            t3 = horloge()
+            INSTRUMENTATION.ajouter("parse", t2 - t1)
+            INSTRUMENTATION.ajouter("score", t3 - t2)
+            INSTRUMENTATION.formule(cle, t3 - t1)
+        _CACHE_ANALYSE.put(cle, resultat)
+        _vers_persistant(cle, resultat)
+    return resultat
+
+
+def analyser_lot(formules):
+    """
+    Analyse un lot de formules caryotypiques sans construire de DataFrame.
+    Les erreurs sont reportées formule par formule.
+    Renvoie un ResultatLot (cf. ResultatLot.to_dataframe pour pandas).
+    """
+    lot = ResultatLot()
+    vocabulaire = Vocabulaire()
+    mesure = INSTRUMENTATION.actif
+    if mesure:
+        debut = horloge()
+    for formule in formules:
+        try:
+            resultat = _analyser_normalisee(normaliser_formule(formule), vocabulaire)
+        except Exception as e:
+            lot.ajouter_erreur(f"Erreur lors de l'analyse de la formule: {str(e)}")
+            continue
+        lot.ajouter(*resultat)
+    _flush_persistant()
+    if mesure:
+        INSTRUMENTATION.ajouter("lot", horloge() - debut, len(lot))
+    return lot
+
+
+def analyser_lot_parallele(formules, workers=None, taille_chunk=2000, executor=None):
+    """
+    Variante multi-processus de analyser_lot.
+    Les formules sont découpées en paquets de ``taille_chunk`` analysés dans
+    un ProcessPoolExecutor de ``workers`` processus (par défaut: nombre de
+    cœurs). Les résultats sont rendus dans l'ordre d'entrée, avec les
+    erreurs formule par formule comme analyser_lot.
+    Un ``executor`` déjà ouvert peut être fourni pour être réutilisé
+    d'un appel à l'autre.
+    """
+    formules = list(formules)
+    workers = workers or os.cpu_count() or 1
+
+    # Seules les formules distinctes absentes du cache partent aux processus
+    cles = {}
+    for formule in formules:
+        try:
+            cles.setdefault(normaliser_formule(formule))
+        except Exception:
+            pass
+    a_calculer = [
+        cle for cle in cles
+        if cle not in _CACHE_ANALYSE and _depuis_persistant(cle) is None
+    ]
+    chunks = [a_calculer[i:i + taille_chunk] for i in range(0, len(a_calculer), taille_chunk)]
+    # Pas de pool pour un seul paquet: le coût de démarrage dominerait
+    if executor is None and (workers <= 1 or len(chunks) <= 1):
+        return analyser_lot(formules)
+
+    if executor is not None:
+        partiels = list(executor.map(analyser_lot, chunks))
+    else:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # forkserver: appel possible depuis un thread (verrous des caches)
+        contexte = multiprocessing.get_context("forkserver")
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=contexte) as executor:
+            partiels = list(executor.map(analyser_lot, chunks))
+
+    calcules = {}
+    for chunk, partiel in zip(chunks, partiels):
+        for i, cle in enumerate(chunk):
+            if partiel.erreurs[i] is None:
+                resultat = (
+                    tuple(partiel.anomalies(i)),
+                    partiel.totaux_jondreville[i],
+                    partiel.totaux_iscn[i],
+                )
+                calcules[cle] = resultat
+                _CACHE_ANALYSE.put(cle, resultat)
+                _vers_persistant(cle, resultat)
+
+    lot = ResultatLot()
+    servies = set()
+    for formule in formules:
+        try:
+            cle = normaliser_formule(formule)
+            resultat = calcules.get(cle)
+            if resultat is not None:
+                # Calculée par un processus du pool: miss à la première
+                # occurrence, hit pour les répétitions (comme analyser_lot)
+                _CACHE_ANALYSE.compter(cle in servies)
+                servies.add(cle)
+            else:
+                resultat = _analyser_normalisee(cle)
+        except Exception as e:
+            lot.ajouter_erreur(f"Erreur lors de l'analyse de la formule: {str(e)}")
+            continue
+        lot.ajouter(*resultat)
+    _flush_persistant()
+    return lot
+
+def _identifiants_formule(cle, vocabulaire, parties):
+    """
+    Anomalies d'une formule normalisée, internées dans ``vocabulaire``,
+    comme parse_caryotype mais sans clone_map ni description des clones.
+    ``parties`` ({texte du clone: identifiants}) mémorise les clones
+    répétés d'une formule à l'autre (clone normal, lignée souche).
+    """
+    identifiants = []
+    for texte in cle.split('/'):
+        ids = parties.get(texte)
+        if ids is None:
+            ids = parties[texte] = [vocabulaire.identifiant(a) for a in _anomalies_clone(texte)]
+        identifiants.extend(ids)
+    return identifiants
+
+
+def compter_lot(formules):
+    """
+    Mode comptage seul de analyser_lot: mêmes totaux et erreurs, sans
+    lignes d'anomalies (ResultatLot.anomalies vide), types ni explications.
+    Le découpage des formules ne décrit pas les clones et les anomalies
+    ne sont qualifiées que pour le score: environ 1,8 fois le débit de
+    analyser_lot sur le benchmark (comptage / lot de baseline.json), la
+    tokenisation des anomalies nouvelles et la détection des implicites,
+    communes aux deux modes, restant l'essentiel du coût. Les analyses
+    détaillées déjà en cache sont réutilisées; les totaux calculés ici n'y
+    sont pas ajoutés.
+    """
+    lot = ResultatLot()
+    vocabulaire = Vocabulaire()
+    # Totaux déjà calculés dans ce lot, par formule et par clone
+    totaux = {}
+    parties = {}
+    mesure = INSTRUMENTATION.actif
+    if mesure:
+        debut = horloge()
+    for formule in formules:
+        try:
+            cle = normaliser_formule(formule)
+            total = totaux.get(cle)
+            if total is None:
+                resultat = _CACHE_ANALYSE.get(cle) if cle in _CACHE_ANALYSE else None
+                if resultat is not None:
+                    total = resultat[1:]
+                else:
+                    total = _compter_identifiants(_identifiants_formule(cle, vocabulaire, parties), vocabulaire)[:2]
+                totaux[cle] = total
+        except Exception as e:
+            lot.ajouter_erreur(f"Erreur lors de l'analyse de la formule: {str(e)}")
+            continue
+        lot.ajouter((), *total)
+    if mesure:
+        INSTRUMENTATION.ajouter("comptage", horloge() - debut, len(lot))
+    return lot
+
+
+def compter_formule(formule):
+    """
+    Mode comptage seul d'une formule: {nom du schéma: total} pour tous les
+    schémas enregistrés (cf. karyo_regles.enregistrer_schema).
+    Lève une exception si la formule ne peut pas être analysée.
+    """
+    vocabulaire = Vocabulaire()
+    identifiants = _identifiants_formule(normaliser_formule(formule), vocabulaire, {})
+    totaux = _compter_identifiants(identifiants, vocabulaire)
+    return {schema.nom: total for schema, total in zip(vocabulaire.schemas, totaux)}
 
 # Fonction pour analyser une formule caryotypique
 def analyser_formule(formule):
@@ -337,9 +1302,8 @@ def analyser_formule(formule):
     - Le score total
     - Une erreur éventuelle
     """
-    try:
-        anomalies, clone_map = parse_caryotype(formule)
-        df, total = calcul_scores(anomalies, clone_map)
-        return df, total, None
-    except Exception as e:
-        return None, 0, f"Erreur lors de l'analyse de la formule: {str(e)}"
+    lot = analyser_lot([formule])
+    if lot.erreurs[0]:
+        return None, 0, lot.erreurs[0]
+    df = _dataframe_formule(lot.lignes, lot.totaux_jondreville[0], lot.totaux_iscn[0])
+    return df, lot.totaux_iscn[0], None
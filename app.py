@@ -1,10 +1,28 @@
 import streamlit as st
 import pandas as pd
-import re
-import base64
-import io
-import openpyxl
-from My_expert_karyo_functions import analyser_formule
+import os
+import hashlib
+from My_expert_karyo_functions import (
+    CacheLRU,
+    activer_cache_persistant,
+    analyser_lot,
+    cache_persistant,
+    stats_cache_analyse,
+    vider_cache_analyse,
+)
+from karyo_cohorte import SEUIL_COMPLEXE, SEUIL_TRES_COMPLEXE, scores_depuis_resultats, synthese_cohorte
+from karyo_export import (
+    COLONNES_ANOMALIES,
+    ecrire_csv,
+    ecrire_table_parquet,
+    ecrire_xlsx,
+    en_octets,
+    lignes_anomalies,
+    parquet_disponible,
+)
+from karyo_flux import ColonneFormuleManquante
+from karyo_instrumentation import INSTRUMENTATION, horloge
+from karyo_traitement import TraitementFichier
 
 # Configuration de la page
 st.set_page_config(
@@ -13,22 +31,14 @@ st.set_page_config(
     layout="wide"
 )
 
+# Suivi des analyses de fichiers en arrière-plan (secondes)
+DELAI_AFFICHAGE_DIRECT = 0.5
+INTERVALLE_SUIVI = 0.5
+INTERVALLE_RESULTATS = 2.0
+
 # Titre de l'application
 st.title("Analyseur de Formules Caryotypiques (ISCN)")
 
-# Fonction pour créer un lien de téléchargement Excel
-def get_excel_download_link(df, filename="resultats_analyse.xlsx"):
-    """
-    Crée un lien HTML pour télécharger un DataFrame en Excel
-    """
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Résultats')
-    excel_data = output.getvalue()
-    b64 = base64.b64encode(excel_data).decode()
-    href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="{filename}" class="download-button">Télécharger les résultats en Excel</a>'
-    return href
-
 # Fonction pour formater les explications avec des puces colorées
 def format_anomalies_html(anomalies_df):
     """
@@ -71,16 +81,16 @@ def format_anomalies_html(anomalies_df):
     return html
 
 # Fonction pour un affichage compact similaire à l'analyse par fichier
-def format_anomalies_compact(anomalies_df):
-    """Renvoie un HTML condensé pour la liste des anomalies"""
+def format_anomalies_compact(lignes):
+    """Renvoie un HTML condensé pour la liste des anomalies (LigneAnomalie)"""
     html = ""
-    for _, row in anomalies_df.iterrows():
-        score = row['Score ISCN 2024']
-        anomalie = row['Anomalie']
-        clones_list = row['Clones'].split(', ')
+    for ligne in lignes:
+        score = ligne.score_iscn
+        anomalie = ligne.anomalie
+        clones_list = ligne.clones.split(', ')
         clones_clean = list(dict.fromkeys(clones_list))
         clones = ', '.join(clones_clean)
-        explication = row['Explication']
+        explication = ligne.explication
 
         if score == 2:
             color = "#FF5733"
@@ -102,6 +112,102 @@ def format_anomalies_compact(anomalies_df):
         """
     return html
 
+# Traitements de fichiers terminés, partagés entre sessions par contenu
+# (clé: empreinte du contenu, nom du fichier, nombre de processus)
+@st.cache_resource
+def traitements_termines():
+    return CacheLRU(8)
+
+def memoriser_traitement(tache):
+    traitements_termines().put(tache.cle, tache)
+    # Référence des comparaisons: propre à la session (jamais le fichier
+    # du même nom chargé par un autre utilisateur)
+    st.session_state.setdefault("derniers_traitements", {})[tache.nom] = tache
+
+def comparaison_session(tache):
+    """Comparaison du traitement s'il a été lancé par cette session, sinon None."""
+    if tache.cle is None or tache.cle not in st.session_state.get("traitements_lances", ()):
+        return None
+    return tache.comparaison
+
+def traitement_fichier(contenu, nom, workers=1):
+    """
+    Traitement en arrière-plan du fichier chargé dans cette session:
+    celui en cours s'il porte sur le même fichier, un traitement terminé
+    identique, ou un nouveau traitement. Un nouveau traitement repart du
+    précédent de la session (le traitement en cours, sinon le dernier du
+    même nom): seules les formules nouvelles ou modifiées sont analysées,
+    et les modifications ne sont listées que pour un fichier du même nom.
+    Seuls les traitements terminés de contenu identique sont repris
+    d'une session à l'autre.
+    """
+    cle = (hashlib.blake2b(contenu, digest_size=16).hexdigest(), nom, workers)
+    tache = st.session_state.get("traitement")
+    if tache is not None and tache.cle == cle:
+        return tache
+    precedent = tache
+    if precedent is not None and not precedent.termine():
+        precedent.annuler()
+    tache = traitements_termines().get(cle)
+    if tache is None:
+        if precedent is None or precedent.erreur is not None:
+            precedent = st.session_state.get("derniers_traitements", {}).get(nom)
+        tache = TraitementFichier(contenu, nom, workers, cle=cle, precedent=precedent).demarrer()
+        st.session_state.setdefault("traitements_lances", set()).add(cle)
+        # Petits fichiers: résultats affichés dès ce passage
+        tache.attendre(DELAI_AFFICHAGE_DIRECT)
+    st.session_state["traitement"] = tache
+    return tache
+
+def synthese_traitement(tache):
+    """Synthèse de cohorte d'un traitement, calculée une fois par session."""
+    memo = st.session_state.get("synthese")
+    if memo is None or memo[0] is not tache:
+        scores, counts = scores_depuis_resultats(tache.results)
+        memo = (tache, synthese_cohorte(tache.table, scores, counts))
+        st.session_state["synthese"] = memo
+    return memo[1]
+
+def afficher_comparaison(comparaison):
+    """Modifications du fichier par rapport à son chargement précédent."""
+    nb_disparues = comparaison.nb_disparues
+    st.info(
+        f"Fichier comparé au chargement précédent: {comparaison.nb_identiques} ligne(s) identique(s), "
+        f"{comparaison.nb_analysees} formule(s) nouvelle(s) ou modifiée(s) analysée(s), "
+        f"{comparaison.nb_reprises} autre(s) ligne(s) ajoutée(s) ou dont le comptage manuel a changé, "
+        f"{nb_disparues} ligne(s) précédente(s) sans équivalent."
+    )
+    if comparaison.modifications:
+        with st.expander(f"Modifications ({len(comparaison.modifications)})"):
+            st.caption("Numéros de ligne du nouveau fichier, ou du précédent pour les lignes supprimées.")
+            st.dataframe(pd.DataFrame(comparaison.modifications), hide_index=True)
+
+def afficher_progression(tache):
+    """
+    Barre de progression rafraîchie en tâche de fond (fragment), avec
+    bouton d'annulation. La page entière est réaffichée quand de nouveaux
+    résultats sont disponibles ou que le traitement se termine.
+    """
+    paquets_affiches = tache.nb_paquets
+    affichage = horloge()
+
+    @st.fragment(run_every=INTERVALLE_SUIVI)
+    def suivi():
+        if tache.termine() or (
+            tache.nb_paquets != paquets_affiches and horloge() - affichage >= INTERVALLE_RESULTATS
+        ):
+            st.rerun()
+        estime = f" / ~{tache.nb_lignes_estime}" if tache.nb_lignes_estime else ""
+        st.progress(
+            tache.progression(),
+            text=f"Analyse en cours: {tache.nb_traitees}{estime} lignes ({tache.debit():.0f} lignes/s)",
+        )
+        if st.button("Annuler l'analyse", key="annuler_analyse"):
+            tache.annuler()
+            st.rerun()
+
+    suivi()
+
 # Interface utilisateur
 st.markdown("""
 Cette application permet d'analyser des formules caryotypiques (notation ISCN) pour :
@@ -110,8 +216,33 @@ Cette application permet d'analyser des formules caryotypiques (notation ISCN) p
 - Comparer le comptage automatique avec un comptage manuel (si disponible)
 """)
 
+# Cache persistant optionnel: chemin de la base SQLite dans KARYO_CACHE_DB
+if os.environ.get("KARYO_CACHE_DB") and cache_persistant() is None:
+    activer_cache_persistant(os.environ["KARYO_CACHE_DB"])
+
+# Instrumentation optionnelle (KARYO_INSTRUMENTATION=1): réglage du
+# processus, commun à toutes les sessions, fixé au démarrage
+@st.cache_resource
+def activer_instrumentation():
+    if os.environ.get("KARYO_INSTRUMENTATION", "") not in ("", "0"):
+        INSTRUMENTATION.activer()
+
+activer_instrumentation()
+
+# Paramètres de calcul
+st.sidebar.header("Paramètres")
+nb_workers = st.sidebar.number_input(
+    "Processus pour l'analyse de fichier",
+    min_value=1,
+    max_value=os.cpu_count() or 1,
+    value=os.cpu_count() or 1,
+    help="Nombre de processus utilisés pour analyser les fichiers volumineux"
+)
+
 # Création des onglets
-tab1, tab2 = st.tabs(["Analyse d'une formule", "Analyse d'un fichier"])
+tab1, tab2, tab3 = st.tabs(["Analyse d'une formule", "Analyse d'un fichier", "Synthèse de cohorte"])
+synthese = None
+analyse_en_cours = False
 
 # Onglet 1: Analyse d'une formule
 with tab1:
@@ -120,7 +251,8 @@ with tab1:
     
     if st.button("Analyser la formule", key="analyser_formule"):
         if formule:
-            df, total, error = analyser_formule(formule)
+            lot = analyser_lot([formule])
+            total, error = lot.totaux_iscn[0], lot.erreurs[0]
             if error:
                 st.error(error)
             else:
@@ -130,8 +262,7 @@ with tab1:
                 st.markdown("### Détail des anomalies")
                 
                 # Formatage des anomalies pour l'affichage
-                anomalies_df = df.iloc[:-1]  # Exclure la ligne TOTAL
-                anomalies_html = format_anomalies_compact(anomalies_df)
+                anomalies_html = format_anomalies_compact(lot.anomalies(0))
                 st.markdown(anomalies_html, unsafe_allow_html=True)
                 
                 # Affichage du total
@@ -146,78 +277,57 @@ with tab2:
     
     if uploaded_file is not None:
         try:
-            # Déterminer le type de fichier
-            if uploaded_file.name.endswith('.csv'):
-                df_input = pd.read_csv(uploaded_file)
-            else:  # Excel
-                df_input = pd.read_excel(uploaded_file)
-            
-            # Rechercher la colonne Formule de manière insensible à la casse
-            formule_col = None
-            for col in df_input.columns:
-                if col.strip().lower() == 'formule':
-                    formule_col = col
-                    break
-
-            if formule_col is None:
-                st.error("Le fichier doit contenir au moins une colonne 'Formule'.")
-            else:
-                # Renommer la colonne trouvée en 'Formule' pour simplifier la suite
-                if formule_col != 'Formule':
-                    df_input = df_input.rename(columns={formule_col: 'Formule'})
-                # Vérifier si la colonne Count existe
-                has_count = 'Count' in df_input.columns
-                
-                # Création du DataFrame de résultats
-                results = []
-                all_anomalies_details = []
-
-                for idx, row in df_input.iterrows():
-                    formule_fichier = row['Formule']
-                    count_manuel = row['Count'] if has_count else None
-
-                    df_analyse, count_auto, error = analyser_formule(formule_fichier)
-                    
-                    if error:
-                        anomalies_detail = error
-                        match = "❌" if has_count else "N/A"
-                        all_anomalies_details.append({"error": True, "message": error})
-                    else:
-                        # Extraction des détails des anomalies
-                        anomalies_df = df_analyse.iloc[:-1]  # Exclure la ligne TOTAL
-                        
-                        # Stocker les détails pour l'affichage
-                        all_anomalies_details.append({"error": False, "df": anomalies_df})
-                        
-                        # Texte simple pour l'export
-                        anomalies_detail = ", ".join([
-                            f"{row['Anomalie']} ({row['Type']}): {row['Score ISCN 2024']} pts"
-                            for _, row in anomalies_df.iterrows()
-                        ])
-                        
-                        # Vérification de la correspondance si Count est disponible
-                        match = "✅" if has_count and count_auto == count_manuel else "❌" if has_count else "N/A"
-                    
-                    result_row = {
-                        # Ne pas compter la ligne d'en-tête
-                        "Ligne": idx + 1,
-                        "Formule": formule_fichier,
-                        "Comptage automatique": count_auto if not error else "Erreur",
-                        "Anomalies détectées": anomalies_detail  # Version texte pour l'export
-                    }
-                    
-                    # Ajouter le comptage manuel si disponible
-                    if has_count:
-                        result_row["Comptage manuel"] = count_manuel
-                        result_row["Correspondance"] = match
-                    
-                    results.append(result_row)
-                
-                # Création du DataFrame de résultats
-                results_df = pd.DataFrame(results)
-                
+            # Lecture et analyse par paquets en arrière-plan (résultats partiels
+            # affichés au fur et à mesure)
+            tache = traitement_fichier(uploaded_file.getvalue(), uploaded_file.name, nb_workers)
+            if tache.complet():
+                memoriser_traitement(tache)
+            results, all_anomalies_details, has_count = tache.instantane()
+            table_anomalies = tache.table
+
+            formule_manquante = isinstance(tache.erreur, ColonneFormuleManquante)
+            if formule_manquante:
+                st.error(str(tache.erreur))
+            elif tache.erreur is not None:
+                raise tache.erreur
+
+            analyse_en_cours = not tache.termine()
+            comparaison = comparaison_session(tache)
+            if analyse_en_cours:
+                afficher_progression(tache)
+            elif tache.annule():
+                st.warning(f"Analyse annulée après {tache.nb_traitees} ligne(s): résultats partiels.")
+                if st.button("Relancer l'analyse", key="relancer_analyse"):
+                    # Nouveau traitement, repartant des lignes déjà analysées
+                    tache.cle = None
+                    st.rerun()
+            elif comparaison is not None and comparaison.complete:
+                afficher_comparaison(comparaison)
+
+            if not formule_manquante:
                 # Affichage des résultats
                 st.markdown("### Résultats de l'analyse")
+
+                # Filtre et pagination: seules les lignes de la page sont rendues
+                cols = st.columns(3)
+                with cols[0]:
+                    taille_page = st.selectbox("Lignes par page", [25, 50, 100, 200], index=1, key="taille_page")
+                with cols[1]:
+                    seulement_ecarts = has_count and st.checkbox(
+                        "Non-correspondances uniquement", key="seulement_ecarts"
+                    )
+                indices = range(len(results))
+                if seulement_ecarts:
+                    indices = [i for i, r in enumerate(results) if r["Correspondance"] != "✅"]
+                nb_pages = max(1, -(-len(indices) // taille_page))
+                with cols[2]:
+                    page = st.number_input("Page", min_value=1, max_value=nb_pages, value=1, key="page")
+                indices_page = indices[(page - 1) * taille_page:page * taille_page]
+                if indices_page:
+                    st.caption(
+                        f"Lignes {(page - 1) * taille_page + 1}–{(page - 1) * taille_page + len(indices_page)}"
+                        f" sur {len(indices)} (page {page}/{nb_pages})"
+                    )
                 
                 # Créer un en-tête de tableau personnalisé
                 cols = st.columns([1, 3, 1, 1, 1, 4] if has_count else [1, 3, 1, 6])
@@ -235,8 +345,10 @@ with tab2:
                 with cols[-1]:
                     st.markdown("**Anomalies détectées**")
                 
-                # Afficher chaque ligne avec un expander pour les anomalies
-                for i, (_, row_data) in enumerate(results_df.iterrows()):
+                # Afficher chaque ligne de la page avec ses anomalies
+                debut_rendu = horloge()
+                for i in indices_page:
+                    row_data = results[i]
                     anomalies = all_anomalies_details[i]
 
                     # Créer une ligne de tableau
@@ -266,44 +378,156 @@ with tab2:
                         if anomalies["error"]:
                             st.error(anomalies["message"])
                         else:
-                            html = format_anomalies_compact(anomalies["df"])
+                            html = format_anomalies_compact(anomalies["lignes"])
                             st.markdown(html, unsafe_allow_html=True)
                                         
                     # Ligne de séparation
                     st.markdown("---")
+
+                if INSTRUMENTATION.actif:
+                    INSTRUMENTATION.ajouter("rendu", horloge() - debut_rendu, len(indices_page))
                 
-                # Statistiques si Count est disponible
-                if has_count:
-                    nb_total = len(results_df)
-                    nb_match = results_df['Correspondance'].value_counts().get("✅", 0)
-                    st.success(f"Correspondance: {nb_match}/{nb_total} ({int(nb_match/nb_total*100 if nb_total else 0)}%)")
+                # Statistiques et exports une fois le traitement terminé
+                if analyse_en_cours:
+                    st.info("Statistiques et exports disponibles à la fin de l'analyse.")
+                else:
+                    # Statistiques si Count est disponible
+                    synthese = synthese_traitement(tache)
+                    if has_count:
+                        accord = synthese["concordance"]
+                        st.success(
+                            f"Correspondance: {accord['nb_concordants']}/{accord['nb_compares']} "
+                            f"({int(accord['taux'] * 100)}%)"
+                        )
                 
-                # Option d'export Excel
-                st.subheader("Exporter les résultats")
-                st.markdown(get_excel_download_link(results_df), unsafe_allow_html=True)
+                    # Exports générés uniquement au clic sur le bouton
+                    st.subheader("Exporter les résultats")
+                    colonnes_resultats = list(results[0]) if results else ["Ligne", "Formule"]
+                    cols = st.columns(4)
+                    with cols[0]:
+                        st.download_button(
+                            "Excel (résultats + anomalies)",
+                            data=lambda: en_octets(ecrire_xlsx, [
+                                ("Résultats", colonnes_resultats, results),
+                                ("Anomalies", COLONNES_ANOMALIES, lignes_anomalies(results, all_anomalies_details)),
+                            ]),
+                            file_name="resultats_analyse.xlsx",
+                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            on_click="ignore",
+                        )
+                    with cols[1]:
+                        st.download_button(
+                            "CSV résultats",
+                            data=lambda: en_octets(ecrire_csv, colonnes_resultats, results),
+                            file_name="resultats_analyse.csv",
+                            mime="text/csv",
+                            on_click="ignore",
+                        )
+                    with cols[2]:
+                        st.download_button(
+                            "CSV anomalies",
+                            data=lambda: en_octets(
+                                ecrire_csv, COLONNES_ANOMALIES, lignes_anomalies(results, all_anomalies_details)
+                            ),
+                            file_name="anomalies_analyse.csv",
+                            mime="text/csv",
+                            on_click="ignore",
+                        )
+                    if parquet_disponible():
+                        with cols[3]:
+                            # Format long en colonnes (codes + dictionnaires), cf. TableAnomalies
+                            st.download_button(
+                                "Parquet anomalies",
+                                data=lambda: en_octets(ecrire_table_parquet, table_anomalies),
+                                file_name="anomalies_analyse.parquet",
+                                mime="application/octet-stream",
+                                on_click="ignore",
+                            )
                 
         except Exception as e:
             st.error(f"Erreur lors de l'analyse du fichier: {str(e)}")
 
+# Onglet 3: Synthèse de cohorte du fichier chargé
+with tab3:
+    if analyse_en_cours:
+        st.info("Synthèse disponible à la fin de l'analyse du fichier.")
+    elif synthese is None:
+        st.info("Chargez un fichier dans l'onglet « Analyse d'un fichier » pour afficher sa synthèse.")
+    else:
+        st.subheader("Synthèse de la cohorte")
+        cols = st.columns(5)
+        cols[0].metric("Caryotypes analysés", synthese["nb_analyses"],
+                       help=f"{synthese['nb_erreurs']} formule(s) en erreur")
+        cols[1].metric("Score ISCN 2024 moyen", f"{synthese['score_moyen']:.2f}",
+                       help=f"Médiane: {synthese['score_median']:g}")
+        cols[2].metric(f"Complexes (≥{SEUIL_COMPLEXE})", f"{synthese['taux_complexes']:.1%}",
+                       help=f"{synthese['nb_complexes']} caryotype(s)")
+        cols[3].metric(f"Très complexes (≥{SEUIL_TRES_COMPLEXE})", f"{synthese['taux_tres_complexes']:.1%}",
+                       help=f"{synthese['nb_tres_complexes']} caryotype(s)")
+        cols[4].metric("Caryotypes monosomiques", f"{synthese['taux_monosomiques']:.1%}",
+                       help=f"{synthese['nb_monosomiques']} caryotype(s) (Breems et al. 2008)")
+
+        st.markdown("#### Distribution des scores ISCN 2024")
+        st.bar_chart(synthese["distribution"].set_index("Score ISCN 2024")["Caryotypes"])
+
+        st.markdown("#### Types d'anomalie les plus fréquents")
+        st.dataframe(
+            synthese["types_frequents"],
+            hide_index=True,
+            column_config={"Proportion": st.column_config.NumberColumn(format="percent")},
+        )
+
+        accord = synthese["concordance"]
+        if accord is not None:
+            st.markdown("#### Concordance avec le comptage manuel (Count)")
+            cols = st.columns(3)
+            cols[0].metric("Concordance", f"{accord['taux']:.1%}",
+                           help=f"{accord['nb_concordants']}/{accord['nb_compares']} formule(s)")
+            cols[1].metric("Écart moyen (auto − manuel)", f"{accord['ecart_moyen']:+.2f}")
+            cols[2].metric("Écart absolu moyen", f"{accord['ecart_absolu_moyen']:.2f}")
+
+# Statistiques du cache d'analyse (après les analyses de ce passage)
+with st.sidebar.expander("Cache d'analyse"):
+    stats_cache = stats_cache_analyse()
+    st.markdown(
+        f"- Hits: {stats_cache['hits']}\n"
+        f"- Misses: {stats_cache['misses']}\n"
+        f"- Évictions: {stats_cache['evictions']}\n"
+        f"- Taille: {stats_cache['taille']}/{stats_cache['taille_max']}\n"
+        f"- Taux de hit: {stats_cache['taux_hit']:.0%}"
+    )
+    persistant = cache_persistant()
+    if persistant is not None:
+        stats_disque = persistant.stats()
+        st.markdown(
+            f"**Cache persistant** ({stats_disque['chemin']})\n"
+            f"- Hits: {stats_disque['hits']}\n"
+            f"- Misses: {stats_disque['misses']}\n"
+            f"- Entrées: {stats_disque['taille']}"
+        )
+    if st.button("Vider le cache", key="vider_cache"):
+        vider_cache_analyse()
+        if persistant is not None:
+            persistant.vider()
+
+# Rapport d'instrumentation (optionnel, toutes sessions confondues)
+if INSTRUMENTATION.actif:
+    with st.sidebar.expander("Instrumentation", expanded=True):
+        st.caption("Mesures du processus, toutes sessions confondues.")
+        st.json(INSTRUMENTATION.rapport())
+        st.download_button(
+            "Rapport JSON",
+            data=INSTRUMENTATION.json(indent=2),
+            file_name="instrumentation.json",
+            mime="application/json",
+            on_click="ignore",
+        )
+        if st.button("Réinitialiser", key="reinitialiser_instrumentation"):
+            INSTRUMENTATION.reinitialiser()
+
 # CSS pour améliorer l'apparence
 st.markdown("""
 <style>
-    .download-button {
-        display: inline-block;
-        padding: 10px 20px;
-        background-color: #4CAF50;
-        color: white;
-        text-decoration: none;
-        border-radius: 4px;
-        margin-top: 10px;
-        font-weight: bold;
-        text-align: center;
-    }
-    
-    .download-button:hover {
-        background-color: #45a049;
-    }
-    
     h3 {
         margin-top: 30px;
         margin-bottom: 20px;
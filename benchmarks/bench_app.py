@@ -0,0 +1,226 @@
+"""
+Benchmark de latence de l'interface Streamlit, sans navigateur.
+
+L'application (app.py) est pilotée par le harnais de test de Streamlit
+(streamlit.testing.v1.AppTest) avec un fichier CSV synthétique
+(Formule, Count) de chaque taille; st.file_uploader est remplacé par une
+fonction renvoyant ce fichier. Pour chaque interaction, on mesure la durée
+d'exécution du script (médiane sur plusieurs répétitions) et, lors d'un
+passage séparé, le pic mémoire alloué en plus de la mémoire déjà occupée
+(tracemalloc):
+- ouverture : premier affichage, sans fichier
+- chargement : affichage suivant le dépôt du fichier, puis
+  premier_resultat (premières lignes affichées) et complet (statistiques
+  et exports affichés), depuis le dépôt, en réaffichant la page toutes
+  les INTERVALLE_SUIVI secondes comme le suivi de l'application
+- reaffichage : nouvelle exécution sans changement (clic sans effet)
+- page_suivante / page_precedente : pagination des résultats
+- taille_page : 200 lignes par page
+- ecarts : filtre "Non-correspondances uniquement"
+- formule : analyse d'une formule dans le premier onglet
+Toute durée dépassant la baseline (clé "latences_app" de baseline.json)
+au-delà de la tolérance fait échouer le benchmark.
+
+Exemples (depuis la racine du dépôt):
+    python -m benchmarks.bench_app
+    python -m benchmarks.bench_app --tailles 100,1000 --sans-memoire
+    python -m benchmarks.bench_app --maj-baseline
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from My_expert_karyo_functions import compter_lot, vider_cache_analyse
+from benchmarks.bench_karyo import BASELINE, RACINE, charger_baseline
+from benchmarks.generateur_iscn import generer_formules
+
+APP = os.path.join(RACINE, "app.py")
+FORMULE = "47,XX,+8,t(9;22)(q34;q11.2)[20]"
+# Réaffichage de la page pendant l'analyse (cf. app.INTERVALLE_SUIVI)
+INTERVALLE_SUIVI = 0.5
+
+class FichierDepose(io.BytesIO):
+    """Fichier déposé, tel que le rend st.file_uploader (contenu + nom)."""
+
+    def __init__(self, contenu, name):
+        super().__init__(contenu)
+        self.name = name
+
+
+def generer_csv(taille, graine=42):
+    """Contenu CSV (Formule, Count) de ``taille`` formules; une sur dix en désaccord."""
+    formules = generer_formules(taille, graine=graine)
+    totaux = compter_lot(formules).totaux_iscn
+    sortie = io.StringIO()
+    ecrivain = csv.writer(sortie)
+    ecrivain.writerow(["Formule", "Count"])
+    for i, (formule, total) in enumerate(zip(formules, totaux)):
+        ecrivain.writerow([formule, total + 1 if i % 10 == 0 else total])
+    return sortie.getvalue().encode("utf-8")
+
+
+def _verifier(at, interaction):
+    if at.exception:
+        raise RuntimeError(f"{interaction}: {at.exception[0].value}")
+    erreurs = [e.value for e in at.error]
+    if erreurs:
+        raise RuntimeError(f"{interaction}: {erreurs[0]}")
+
+
+def _resultats_affiches(at):
+    return any(c.value.startswith("Lignes ") for c in at.caption)
+
+
+def _analyse_terminee(at):
+    return not any(i.value.startswith("Statistiques et exports") for i in at.info)
+
+
+def parcours(contenu, nom, workers=1, memoire=False, delai=600.0):
+    """
+    Déroule les interactions sur une nouvelle session et renvoie
+    {interaction: {"duree_s", "pic_mo"}} (pic_mo None sans ``memoire``),
+    avec en plus "premier_resultat" et "complet" (durées depuis le dépôt).
+    Les caches d'analyses et de traitements sont vidés au préalable.
+    """
+    depose = {"fichier": None}
+    uploader = st.file_uploader
+    st.file_uploader = lambda *args, **kwargs: depose["fichier"]
+    vider_cache_analyse()
+    # Vidage hors session: avertissement du mode sans serveur sans objet
+    # (niveau remis à chaque fois, la configuration de Streamlit l'écrase)
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+    st.cache_resource.clear()
+    mesures = {}
+
+    def mesurer(interaction, action):
+        if memoire:
+            tracemalloc.reset_peak()
+            occupee = tracemalloc.get_traced_memory()[0]
+        debut = time.perf_counter()
+        action()
+        mesures[interaction] = {
+            "duree_s": time.perf_counter() - debut,
+            "pic_mo": (tracemalloc.get_traced_memory()[1] - occupee) / 1e6 if memoire else None,
+        }
+        _verifier(at, interaction)
+
+    try:
+        at = AppTest.from_file(APP, default_timeout=delai)
+        mesurer("ouverture", at.run)
+        at.sidebar.number_input[0].set_value(workers)
+
+        def charger():
+            depose["fichier"] = FichierDepose(contenu, nom)
+            at.run()
+
+        debut = time.perf_counter()
+        mesurer("chargement", charger)
+        while not _resultats_affiches(at) or not _analyse_terminee(at):
+            if "premier_resultat" not in mesures and _resultats_affiches(at):
+                mesures["premier_resultat"] = {"duree_s": time.perf_counter() - debut, "pic_mo": None}
+            if time.perf_counter() - debut > delai:
+                raise RuntimeError(f"chargement: analyse non terminée après {delai:.0f} s")
+            time.sleep(INTERVALLE_SUIVI)
+            at.run()
+            _verifier(at, "chargement")
+        mesures.setdefault("premier_resultat", {"duree_s": time.perf_counter() - debut, "pic_mo": None})
+        mesures["complet"] = {"duree_s": time.perf_counter() - debut, "pic_mo": None}
+
+        mesurer("reaffichage", at.run)
+        mesurer("page_suivante", lambda: at.number_input(key="page").set_value(2).run())
+        mesurer("page_precedente", lambda: at.number_input(key="page").set_value(1).run())
+        mesurer("taille_page", lambda: at.selectbox(key="taille_page").set_value(200).run())
+        mesurer("ecarts", lambda: at.checkbox(key="seulement_ecarts").check().run())
+
+        def analyser_formule():
+            at.text_input[0].input(FORMULE)
+            at.button(key="analyser_formule").click().run()
+
+        mesurer("formule", analyser_formule)
+    finally:
+        st.file_uploader = uploader
+    return mesures
+
+
+def mesurer_taille(taille, repetitions=3, workers=1, memoire=True, graine=42):
+    """Médiane des durées sur ``repetitions`` parcours, pic mémoire d'un parcours à part."""
+    contenu = generer_csv(taille, graine)
+    nom = f"synthetique_{taille}.csv"
+    parcours_ = [parcours(contenu, nom, workers) for _ in range(repetitions)]
+    resultat = {
+        interaction: {"duree_s": statistics.median(p[interaction]["duree_s"] for p in parcours_), "pic_mo": None}
+        for interaction in parcours_[0]
+    }
+    if memoire:
+        tracemalloc.start()
+        try:
+            pics = parcours(contenu, nom, workers, memoire=True)
+        finally:
+            tracemalloc.stop()
+        for interaction, m in pics.items():
+            resultat[interaction]["pic_mo"] = m["pic_mo"]
+    return resultat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tailles", default="100,1000,10000",
+                        help="nombres de lignes du fichier déposé (défaut: 100,1000,10000)")
+    parser.add_argument("--repetitions", type=int, default=3, help="parcours chronométrés par taille (médiane)")
+    parser.add_argument("--workers", type=int, default=1, help="processus pour l'analyse de fichier (défaut: 1)")
+    parser.add_argument("--graine", type=int, default=42, help="graine du générateur")
+    parser.add_argument("--tolerance", type=float, default=0.50,
+                        help="hausse de durée tolérée par rapport à la baseline (défaut: 0.50)")
+    parser.add_argument("--sans-memoire", action="store_true", help="ne pas mesurer le pic mémoire")
+    parser.add_argument("--baseline", default=BASELINE, help="fichier de baseline JSON")
+    parser.add_argument("--maj-baseline", action="store_true", help="enregistrer les mesures comme baseline")
+    parser.add_argument("--json", help="écrire les mesures dans ce fichier JSON")
+    args = parser.parse_args(argv)
+
+    tailles = [int(t) for t in args.tailles.split(",") if t]
+    baseline = charger_baseline(args.baseline)
+    references = baseline.get("latences_app", {})
+    echec = False
+    mesures = {}
+
+    for taille in tailles:
+        resultat = mesurer_taille(taille, args.repetitions, args.workers, not args.sans_memoire, args.graine)
+        for interaction, m in resultat.items():
+            cle = f"{interaction}@{taille}"
+            mesures[cle] = m
+            ref = references.get(cle)
+            statut = ""
+            if ref and not args.maj_baseline:
+                ratio = m["duree_s"] / ref
+                statut = f"{ratio:6.2f}x baseline"
+                if ratio > 1 + args.tolerance:
+                    statut += "  RÉGRESSION"
+                    echec = True
+            pic = f"{m['pic_mo']:8.1f} Mo" if m["pic_mo"] is not None else "       - "
+            print(f"{cle:>24}: {m['duree_s'] * 1000:>9.1f} ms  {pic}  {statut}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mesures": mesures}, f, indent=2, ensure_ascii=False)
+
+    if args.maj_baseline:
+        baseline.setdefault("latences_app", {}).update({k: round(m["duree_s"], 4) for k, m in mesures.items()})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+        print(f"Baseline enregistrée dans {args.baseline}")
+
+    return 1 if echec else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""
+Benchmark du moteur de scoring sur des formules ISCN synthétiques.
+
+Mesure le débit (formules/s) et le pic mémoire (tracemalloc) des étapes:
+- parse : parse_caryotype seul
+- score : scorer_anomalies sur des formules déjà parsées
+- lot : analyser_lot (bout en bout, sans pandas)
+- comptage : compter_lot (totaux seuls, sans types ni explications)
+- formule : analyser_formule (bout en bout, DataFrame par formule)
+
+Le corpus iscn_exemples.csv sert de contrôle de correction: toute formule
+dont le comptage diffère de la colonne Count et qui n'est pas un écart
+connu (baseline.json) fait échouer le benchmark, de même qu'une baisse de
+débit au-delà de la tolérance par rapport à la baseline enregistrée. Les
+anomalies par clone de l'index de cohorte (lignées secondaires comprises,
+cf. CLONES_CONTROLE) sont comparées à Caryotype.anomalies_clone.
+
+Exemples (depuis la racine du dépôt):
+    python -m benchmarks.bench_karyo
+    python -m benchmarks.bench_karyo --tailles 1000,100000,1000000
+    python -m benchmarks.bench_karyo --maj-baseline
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from My_expert_karyo_functions import (
+    Vocabulaire,
+    analyser_formule,
+    analyser_lot,
+    compter_lot,
+    configurer_cache_analyse,
+    parse_caryotype,
+    parser_caryotype,
+    scorer_anomalies,
+    tokeniser_anomalie,
+    TAILLE_CACHE_ANALYSE,
+)
+from benchmarks.generateur_iscn import generer_formules
+from karyo_colonnes import TableAnomalies
+from karyo_index import IndexCohorte
+from karyo_instrumentation import INSTRUMENTATION
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS = os.path.join(RACINE, "iscn_exemples.csv")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def _etape_parse(formules):
+    for f in formules:
+        parse_caryotype(f)
+
+
+def _etape_score(parses):
+    vocabulaire = Vocabulaire()
+    for anomalies, clone_map in parses:
+        scorer_anomalies(anomalies, clone_map, vocabulaire)
+
+
+def _etape_lot(formules):
+    analyser_lot(formules)
+
+
+def _etape_comptage(formules):
+    compter_lot(formules)
+
+
+def _etape_formule(formules):
+    for f in formules:
+        analyser_formule(f)
+
+
+ETAPES = {
+    "parse": _etape_parse,
+    "score": _etape_score,
+    "lot": _etape_lot,
+    "comptage": _etape_comptage,
+    "formule": _etape_formule,
+}
+
+
+def mesurer(etape, donnees, memoire=True):
+    """Débit (formules/s) et pic mémoire (Mo, ou None) d'une étape."""
+    fonction = ETAPES[etape]
+    # Caches vidés: on mesure le calcul, pas la mémoïsation
+    tokeniser_anomalie.cache_clear()
+    debut = time.perf_counter()
+    fonction(donnees)
+    duree = time.perf_counter() - debut
+
+    pic = None
+    if memoire:
+        tokeniser_anomalie.cache_clear()
+        tracemalloc.start()
+        fonction(donnees)
+        pic = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return {"debit": len(donnees) / duree if duree else float("inf"), "pic_mo": pic, "duree_s": duree}
+
+
+def verifier_corpus():
+    """Formules du corpus dont le comptage automatique diffère de Count."""
+    ecarts = []
+    with open(CORPUS, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            _, total, erreur = analyser_formule(row["Formule"])
+            if erreur or total != int(row["Count"]):
+                ecarts.append(row["Formule"])
+    return ecarts
+
+
+# Lignées secondaires: anomalies héritées par "idem", "sl" ou "sdl"
+CLONES_CONTROLE = (
+    "47,XX,+8[5]/48,idem,+8[15]",
+    "47,XY,+8[4]/48,sl,+9[6]/49,sdl,+8[10]",
+    "47,XX,+8,+8[10]/46,XX[10]",
+)
+
+
+def verifier_clones():
+    """
+    Anomalies (formule, clone, anomalie) dont le nombre d'occurrences dans
+    le clone selon IndexCohorte.clones diffère de Caryotype.anomalies_clone,
+    sur le corpus et CLONES_CONTROLE.
+    """
+    with open(CORPUS, newline="", encoding="utf-8") as f:
+        formules = [row["Formule"] for row in csv.DictReader(f)] + list(CLONES_CONTROLE)
+    lot = analyser_lot(formules)
+    index = IndexCohorte(TableAnomalies.depuis_lot(lot, 0, formules), len(formules))
+    # Anomalie -> {(formule, clone): occurrences}, d'après le parseur
+    attendus = {}
+    for i, formule in enumerate(formules):
+        if lot.erreurs[i] is not None:
+            continue
+        caryotype = parser_caryotype(formule)
+        for clone in caryotype.clones:
+            for position in caryotype.anomalies_clone(clone.numero):
+                clones = attendus.setdefault(caryotype.anomalies[position], {})
+                clones[i, clone.numero] = clones.get((i, clone.numero), 0) + 1
+    ecarts = []
+    codes = index.table.dictionnaires['anomalie'].codes
+    for anomalie, clones in attendus.items():
+        selection = np.zeros(len(index.noms), dtype=bool)
+        if anomalie in codes:
+            selection[codes[anomalie]] = True
+        trouves = {}
+        for n in range(1, max(clones.values()) + 2):
+            for formule, clone in index.clones(selection, occurrences_min=n):
+                trouves[int(formule), int(clone)] = n
+        ecarts.extend(
+            (formules[i], numero, anomalie)
+            for i, numero in sorted(clones.keys() | trouves.keys())
+            if clones.get((i, numero)) != trouves.get((i, numero))
+        )
+    return ecarts
+
+
+def charger_baseline(chemin=BASELINE):
+    if not os.path.exists(chemin):
+        return {}
+    with open(chemin, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tailles", default="1000,100000",
+                        help="tailles de lot séparées par des virgules (défaut: 1000,100000)")
+    parser.add_argument("--etapes", default="parse,score,lot,comptage,formule",
+                        help="étapes mesurées (parse, score, lot, comptage, formule)")
+    parser.add_argument("--graine", type=int, default=42, help="graine du générateur")
+    parser.add_argument("--tolerance", type=float, default=0.20,
+                        help="baisse de débit tolérée par rapport à la baseline (défaut: 0.20)")
+    parser.add_argument("--sans-memoire", action="store_true", help="ne pas mesurer le pic mémoire")
+    parser.add_argument("--baseline", default=BASELINE, help="fichier de baseline JSON")
+    parser.add_argument("--maj-baseline", action="store_true", help="enregistrer les mesures comme baseline")
+    parser.add_argument("--json", help="écrire les mesures dans ce fichier JSON")
+    parser.add_argument("--instrumentation",
+                        help="écrire dans ce fichier le rapport d'instrumentation d'un lot "
+                             "de la plus grande taille (mesuré à part)")
+    args = parser.parse_args(argv)
+
+    tailles = [int(t) for t in args.tailles.split(",") if t]
+    etapes = [e for e in args.etapes.split(",") if e]
+    baseline = charger_baseline(args.baseline)
+    echec = False
+
+    # Contrôle de correction
+    ecarts = verifier_corpus()
+    connus = set(baseline.get("ecarts_corpus", []))
+    nouveaux = [e for e in ecarts if e not in connus]
+    print(f"Corpus: {len(ecarts)} écart(s) avec Count ({len(nouveaux)} nouveau(x))")
+    for e in nouveaux:
+        print(f"  ÉCART: {e}")
+    echec |= bool(nouveaux) and not args.maj_baseline
+    ecarts_clones = verifier_clones()
+    print(f"Clones: {len(ecarts_clones)} écart(s) entre l'index et les lignées du parseur")
+    for formule, clone, anomalie in ecarts_clones:
+        print(f"  ÉCART: {formule} (clone {clone}, {anomalie})")
+    echec |= bool(ecarts_clones)
+
+    # Débit et mémoire, sans cache de formules
+    configurer_cache_analyse(0)
+    mesures = {}
+    try:
+        for taille in tailles:
+            formules = generer_formules(taille, graine=args.graine)
+            parses = [parse_caryotype(f) for f in formules] if "score" in etapes else None
+            for etape in etapes:
+                donnees = parses if etape == "score" else formules
+                m = mesurer(etape, donnees, memoire=not args.sans_memoire)
+                cle = f"{etape}@{taille}"
+                mesures[cle] = m
+
+                ref = baseline.get("debits", {}).get(cle)
+                statut = ""
+                if ref and not args.maj_baseline:
+                    ratio = m["debit"] / ref
+                    statut = f"{ratio:6.2f}x baseline"
+                    if ratio < 1 - args.tolerance:
+                        statut += "  RÉGRESSION"
+                        echec = True
+                pic = f"{m['pic_mo']:8.1f} Mo" if m["pic_mo"] is not None else "       - "
+                print(f"{cle:>18}: {m['debit']:>10.0f} formules/s  {pic}  {statut}")
+
+        # Rapport par étape, hors mesures de débit (l'instrumentation a un coût)
+        if args.instrumentation:
+            tokeniser_anomalie.cache_clear()
+            INSTRUMENTATION.activer()
+            try:
+                analyser_lot(generer_formules(max(tailles), graine=args.graine))
+            finally:
+                INSTRUMENTATION.desactiver()
+            with open(args.instrumentation, "w", encoding="utf-8") as f:
+                f.write(INSTRUMENTATION.json(indent=2))
+    finally:
+        configurer_cache_analyse(TAILLE_CACHE_ANALYSE)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mesures": mesures, "ecarts_corpus": ecarts}, f, indent=2, ensure_ascii=False)
+
+    if args.maj_baseline:
+        baseline.setdefault("debits", {}).update({k: round(m["debit"]) for k, m in mesures.items()})
+        baseline["ecarts_corpus"] = ecarts
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+        print(f"Baseline enregistrée dans {args.baseline}")
+
+    return 1 if echec else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Générateur reproductible de formules ISCN synthétiques pour les benchmarks.
+
+Les formules couvrent les cas rencontrés en routine: clones multiples
+(souche, sous-clones "idem", clone normal), ploidies, gains/pertes,
+constitutionnelles (+Nc), translocations, dérivés, dicentriques,
+insertions, isochromosomes, anneaux, marqueurs et anomalies incertaines (?).
+"""
+import random
+
+AUTOSOMES = [str(n) for n in range(1, 23)]
+BANDES = ["p11", "p13", "p15", "p21", "p22", "p36", "q10", "q11.2", "q13", "q21", "q22", "q23", "q31", "q34"]
+
+
+def _bande(rng, bras=None):
+    bande = rng.choice(BANDES)
+    if bras:
+        bande = bras + bande[1:]
+    return bande
+
+
+def _paire(rng):
+    a, b = rng.sample(AUTOSOMES, 2)
+    return sorted((a, b), key=int)
+
+
+def _anomalie(rng):
+    """Une anomalie ISCN tirée selon des fréquences grossièrement réalistes."""
+    c = rng.choice(AUTOSOMES)
+    tirage = rng.random()
+    if tirage < 0.22:
+        anom = f"+{c}"
+    elif tirage < 0.36:
+        anom = f"-{c}"
+    elif tirage < 0.38:
+        anom = f"+{c}c"
+    elif tirage < 0.50:
+        anom = f"del({c})({_bande(rng, 'q')}{_bande(rng, 'q')})"
+    elif tirage < 0.58:
+        a, b = _paire(rng)
+        anom = f"t({a};{b})({_bande(rng)};{_bande(rng)})"
+    elif tirage < 0.66:
+        a, b = _paire(rng)
+        anom = f"der({a})t({a};{b})({_bande(rng)};{_bande(rng)})"
+    elif tirage < 0.69:
+        a, b = _paire(rng)
+        anom = f"dic({a};{b})({_bande(rng, 'p')};{_bande(rng, 'p')})"
+    elif tirage < 0.72:
+        a, b = _paire(rng)
+        anom = f"ins({a};{b})({_bande(rng, 'p')};{_bande(rng, 'q')}{_bande(rng, 'q')})"
+    elif tirage < 0.75:
+        anom = f"dup({c})({_bande(rng, 'q')}{_bande(rng, 'q')})"
+    elif tirage < 0.78:
+        anom = f"i({c})(q10)"
+    elif tirage < 0.80:
+        anom = f"idic({c})({_bande(rng, 'q')})"
+    elif tirage < 0.82:
+        anom = f"ider({c})(q10)del({c})({_bande(rng, 'q')}{_bande(rng, 'q')})"
+    elif tirage < 0.84:
+        anom = f"r({c})({_bande(rng, 'p')}{_bande(rng, 'q')})"
+    elif tirage < 0.86:
+        anom = f"trp({c})({_bande(rng, 'q')}{_bande(rng, 'q')})"
+    elif tirage < 0.89:
+        anom = f"add({c})({_bande(rng)})"
+    elif tirage < 0.91:
+        a, b = _paire(rng)
+        anom = f"der({a};{b})(q10;q10)"
+    elif tirage < 0.93:
+        anom = rng.choice(["+mar", "+mar1", "+2mar"])
+    elif tirage < 0.95:
+        anom = f"{rng.randint(2, 10)}~{rng.randint(11, 30)}dmin"
+    elif tirage < 0.97:
+        anom = f"hsr({c})({_bande(rng, 'q')})"
+    else:
+        anom = f"inv({c})({_bande(rng, 'p')}{_bande(rng, 'q')})"
+    # Anomalies incertaines
+    if rng.random() < 0.04:
+        anom = "?" + anom
+    return anom
+
+
+def _nombre_modal(rng, anomalies):
+    gains = sum(1 for a in anomalies if a.lstrip('?').startswith('+'))
+    pertes = sum(1 for a in anomalies if a.lstrip('?').startswith('-'))
+    return 46 + gains - pertes
+
+
+def generer_formule(rng):
+    """Une formule ISCN complète (un à trois clones anormaux, clone normal optionnel)."""
+    sexe = rng.choice(["XX", "XY"])
+    clones = []
+
+    # Ploidies (rares)
+    tirage = rng.random()
+    if tirage < 0.02:
+        clones.append(f"92,{sexe}{sexe}[{rng.randint(2, 20)}]")
+    elif tirage < 0.04:
+        clones.append(f"69,{sexe}{sexe[-1]}[{rng.randint(2, 20)}]")
+
+    # Souche
+    nb = min(int(rng.expovariate(0.45)) + 1, 20)
+    souche = [_anomalie(rng) for _ in range(nb)]
+    modal = _nombre_modal(rng, souche)
+    if rng.random() < 0.05:
+        clones.append(f"{modal}~{modal + 2},{sexe},{','.join(souche)}[cp{rng.randint(3, 10)}]")
+    else:
+        clones.append(f"{modal},{sexe},{','.join(souche)}[{rng.randint(2, 20)}]")
+
+    # Sous-clones (évolution clonale)
+    for _ in range(rng.choice([0, 0, 0, 1, 1, 2])):
+        ajout = [_anomalie(rng) for _ in range(rng.randint(1, 3))]
+        clones.append(f"{_nombre_modal(rng, souche + ajout)},idem,{','.join(ajout)}[{rng.randint(2, 15)}]")
+
+    # Clone normal résiduel
+    if rng.random() < 0.6:
+        clones.append(f"46,{sexe}[{rng.randint(1, 20)}]")
+    return "/".join(clones)
+
+
+def generer_formules(n, graine=42, part_normaux=0.15, part_recurrents=0.25):
+    """
+    ``n`` formules synthétiques, reproductibles pour une même ``graine``.
+    Une part des formules est normale, une autre tirée parmi des
+    caryotypes récurrents (doublons typiques d'une cohorte réelle).
+    """
+    rng = random.Random(graine)
+    recurrents = [
+        "46,XX[20]", "46,XY[20]", "47,XX,+8[20]", "47,XY,+8[20]",
+        "46,XY,t(8;21)(q22;q22)[18]/46,XY[2]", "46,XX,t(15;17)(q24;q21)[20]",
+        "45,XY,-7[10]/46,XY[10]", "46,XX,del(5)(q13q33)[20]",
+    ]
+    formules = []
+    for _ in range(n):
+        tirage = rng.random()
+        if tirage < part_normaux:
+            formules.append(f"46,{rng.choice(['XX', 'XY'])}[{rng.randint(15, 30)}]")
+        elif tirage < part_normaux + part_recurrents:
+            formules.append(rng.choice(recurrents))
+        else:
+            formules.append(generer_formule(rng))
+    return formules
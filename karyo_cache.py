@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+
+class CachePersistant:
+    """
+    Cache persistant (SQLite) des résultats de scoring.
+
+    Chaque entrée est indexée par une empreinte de la formule normalisée et
+    par la version des règles de scoring. À l'ouverture, les entrées d'une
+    autre version sont supprimées: un changement de règles invalide donc
+    automatiquement l'ancien cache.
+    Les écritures sont regroupées (cf. flush) pour limiter les transactions.
+    """
+
+    def __init__(self, chemin, version, taille_tampon=1000):
+        self.chemin = str(chemin)
+        self.version = version
+        self.taille_tampon = taille_tampon
+        self.hits = self.misses = 0
+        self._tampon = []
+        self._verrou = threading.Lock()
+        # Une connexion SQLite ne doit pas être utilisée après un fork
+        self._pid = os.getpid()
+        self._conn = sqlite3.connect(self.chemin, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS resultats ("
+            " empreinte BLOB NOT NULL,"
+            " version TEXT NOT NULL,"
+            " donnees TEXT NOT NULL,"
+            " PRIMARY KEY (empreinte, version)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("DELETE FROM resultats WHERE version != ?", (version,))
+        self._conn.commit()
+
+    @staticmethod
+    def empreinte(cle):
+        """Empreinte (16 octets) d'une formule normalisée."""
+        return hashlib.blake2b(cle.encode('utf-8'), digest_size=16).digest()
+
+    def actif(self):
+        """Faux dans un processus fils (pool) ou après fermeture."""
+        return self._conn is not None and os.getpid() == self._pid
+
+    def get(self, cle):
+        """Données JSON décodées associées à ``cle``, ou None."""
+        with self._verrou:
+            row = self._conn.execute(
+                "SELECT donnees FROM resultats WHERE empreinte = ? AND version = ?",
+                (self.empreinte(cle), self.version),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, cle, donnees):
+        """Mémorise ``donnees`` (sérialisables en JSON) pour ``cle``."""
+        with self._verrou:
+            self._tampon.append(
+                (self.empreinte(cle), self.version, json.dumps(donnees, ensure_ascii=False))
+            )
+            if len(self._tampon) >= self.taille_tampon:
+                self._flush()
+
+    def flush(self):
+        """Écrit les entrées en attente."""
+        with self._verrou:
+            self._flush()
+
+    def _flush(self):
+        if self._tampon:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO resultats VALUES (?, ?, ?)", self._tampon
+            )
+            self._conn.commit()
+            self._tampon = []
+
+    def __len__(self):
+        with self._verrou:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM resultats WHERE version = ?", (self.version,)
+            ).fetchone()[0]
+
+    def vider(self):
+        """Supprime toutes les entrées."""
+        with self._verrou:
+            self._tampon = []
+            self._conn.execute("DELETE FROM resultats")
+            self._conn.commit()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Compteurs du cache sous forme de dict."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "taille": len(self),
+            "version": self.version,
+            "chemin": self.chemin,
+        }
+
+    def fermer(self):
+        """Écrit les entrées en attente et ferme la base."""
+        if self._conn is None:
+            return
+        if self.actif():
+            self.flush()
+            self._conn.close()
+        self._conn = None
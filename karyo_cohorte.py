@@ -0,0 +1,158 @@
+"""
+Synthèse d'une cohorte de caryotypes scorés.
+
+Calculs vectorisés (pandas/numpy) sur la sortie du scoring par lot:
+TableAnomalies (une ligne par formule, clone et anomalie) et totaux ISCN
+2024 par formule. Les propriétés d'une anomalie (monosomie autosomique,
+anomalie de structure) sont évaluées une fois par entrée du dictionnaire
+des anomalies puis propagées aux lignes par leurs codes, sans relire le
+texte des formules.
+"""
+import numpy as np
+import pandas as pd
+
+# Seuils de complexité (score ISCN 2024)
+SEUIL_COMPLEXE = 3
+SEUIL_TRES_COMPLEXE = 5
+
+# Gains/pertes de chromosomes entiers (éventuellement constitutionnels)
+_NUMERIQUE_RE = r'^[+-](?:\d+|X|Y)c?$'
+_MONOSOMIE_AUTOSOMIQUE_RE = r'^-(?:[1-9]|1\d|2[0-2])$'
+_PLOIDIES = ('Triploidy', 'Tetraploidy', '<2n>')
+
+
+def scores_depuis_resultats(results):
+    """
+    Totaux ISCN 2024 et comptages manuels (ou None) à partir des lignes de
+    résultats de lignes_resultats ("Erreur" -> valeur manquante).
+    """
+    df = pd.DataFrame(results)
+    if df.empty:
+        return pd.Series(dtype=float), None
+    scores = pd.to_numeric(df["Comptage automatique"], errors="coerce")
+    counts = pd.to_numeric(df["Comptage manuel"], errors="coerce") if "Comptage manuel" in df else None
+    return scores, counts
+
+
+def _proprietes_anomalies(table):
+    """Drapeaux (monosomie autosomique, structure) par code d'anomalie."""
+    anomalies = pd.Series(table.dictionnaires['anomalie'].valeurs, dtype=object).str.lstrip('?')
+    monosomie = anomalies.str.match(_MONOSOMIE_AUTOSOMIQUE_RE).to_numpy(dtype=bool)
+    structure = ~(anomalies.str.match(_NUMERIQUE_RE) | anomalies.isin(_PLOIDIES)).to_numpy(dtype=bool)
+    return monosomie, structure
+
+
+def caryotypes_monosomiques(table):
+    """
+    Positions des formules de caryotype monosomique (Breems et al. 2008):
+    au moins deux monosomies autosomiques distinctes, ou une monosomie
+    autosomique associée à au moins une anomalie de structure.
+    """
+    if not len(table):
+        return np.empty(0, dtype=np.int32)
+    col = table.colonnes
+    premier = np.frombuffer(col['premier_clone'], dtype=np.int8).astype(bool)
+    formules = np.frombuffer(col['formule'], dtype=np.int32)[premier]
+    codes = np.frombuffer(col['anomalie'], dtype=np.int32)[premier]
+    monosomie, structure = _proprietes_anomalies(table)
+
+    par_formule = pd.DataFrame({
+        'formule': formules,
+        'monosomies': monosomie[codes],
+        'structures': structure[codes],
+    }).groupby('formule', sort=True).sum()
+    mk = (par_formule['monosomies'] >= 2) | (
+        (par_formule['monosomies'] == 1) & (par_formule['structures'] >= 1)
+    )
+    return par_formule.index[mk.to_numpy()].to_numpy()
+
+
+def types_frequents(table, nb_formules, n=10):
+    """
+    Types d'anomalie les plus fréquents: nombre et proportion de caryotypes
+    portant au moins une anomalie du type.
+    """
+    if not len(table):
+        return pd.DataFrame(columns=["Type", "Caryotypes", "Proportion"])
+    col = table.colonnes
+    paires = pd.DataFrame({
+        'formule': np.frombuffer(col['formule'], dtype=np.int32),
+        'type': np.frombuffer(col['type'], dtype=np.int32),
+    }).drop_duplicates()
+    effectifs = paires['type'].value_counts().head(n)
+    noms = table.dictionnaires['type'].valeurs
+    return pd.DataFrame({
+        "Type": [noms[c] for c in effectifs.index],
+        "Caryotypes": effectifs.to_numpy(),
+        "Proportion": effectifs.to_numpy() / nb_formules if nb_formules else 0.0,
+    })
+
+
+def concordance(scores, counts):
+    """
+    Concordance comptage automatique / comptage manuel, sur toutes les
+    formules comme la colonne Correspondance des résultats: une formule en
+    erreur, ou dont le comptage manuel est vide ou non numérique, est
+    discordante. Écarts calculés sur les formules ayant les deux comptages.
+    """
+    scores = pd.to_numeric(pd.Series(scores), errors="coerce").reset_index(drop=True)
+    counts = pd.to_numeric(pd.Series(counts), errors="coerce").reset_index(drop=True)
+    nb = len(counts)
+    concordants = int((scores == counts).sum())
+    ecarts = (scores - counts).dropna()
+    return {
+        "nb_compares": nb,
+        "nb_concordants": concordants,
+        "taux": concordants / nb if nb else 0.0,
+        "ecart_moyen": float(ecarts.mean()) if len(ecarts) else 0.0,
+        "ecart_absolu_moyen": float(ecarts.abs().mean()) if len(ecarts) else 0.0,
+    }
+
+
+def synthese_cohorte(table, scores, counts=None, n_types=10):
+    """
+    Synthèse d'une cohorte:
+    - table : TableAnomalies du lot (positions de formule 0..n-1)
+    - scores : totaux ISCN 2024 par formule (valeur manquante si erreur)
+    - counts : comptages manuels par formule (optionnel)
+    Renvoie un dict (effectifs, distribution des scores, taux de caryotypes
+    complexes / très complexes / monosomiques, types fréquents, concordance).
+    """
+    scores = pd.to_numeric(pd.Series(scores), errors="coerce").reset_index(drop=True)
+    valides = scores.notna()
+    nb_formules = len(scores)
+    nb_analyses = int(valides.sum())
+    scores_valides = scores[valides].astype(int)
+
+    distribution = scores_valides.value_counts().sort_index()
+    distribution = pd.DataFrame({
+        "Score ISCN 2024": distribution.index,
+        "Caryotypes": distribution.to_numpy(),
+        "Proportion": distribution.to_numpy() / nb_analyses if nb_analyses else 0.0,
+    })
+
+    nb_complexes = int((scores_valides >= SEUIL_COMPLEXE).sum())
+    nb_tres_complexes = int((scores_valides >= SEUIL_TRES_COMPLEXE).sum())
+    monosomiques = caryotypes_monosomiques(table)
+    # Les formules en erreur n'ont pas de ligne dans la table
+    nb_monosomiques = int(valides.to_numpy()[monosomiques].sum()) if len(monosomiques) else 0
+
+    def taux(nb):
+        return nb / nb_analyses if nb_analyses else 0.0
+
+    return {
+        "nb_formules": nb_formules,
+        "nb_analyses": nb_analyses,
+        "nb_erreurs": nb_formules - nb_analyses,
+        "score_moyen": float(scores_valides.mean()) if nb_analyses else 0.0,
+        "score_median": float(scores_valides.median()) if nb_analyses else 0.0,
+        "distribution": distribution,
+        "nb_complexes": nb_complexes,
+        "taux_complexes": taux(nb_complexes),
+        "nb_tres_complexes": nb_tres_complexes,
+        "taux_tres_complexes": taux(nb_tres_complexes),
+        "nb_monosomiques": nb_monosomiques,
+        "taux_monosomiques": taux(nb_monosomiques),
+        "types_frequents": types_frequents(table, nb_analyses, n_types),
+        "concordance": concordance(scores, counts) if counts is not None else None,
+    }
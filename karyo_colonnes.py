@@ -0,0 +1,208 @@
+"""
+Stockage en colonnes (format long) des anomalies scorées.
+
+Une ligne par (formule, clone, anomalie); les chaînes (anomalie, type,
+explication) sont internées une fois dans des dictionnaires et les
+colonnes sont des tableaux ``array`` d'entiers compacts. La conversion
+Arrow réutilise directement ces tampons (pas de copie), les colonnes
+internées devenant des DictionaryArray (catégories côté pandas).
+"""
+from array import array
+
+from My_expert_karyo_functions import masque_chromosomes, parser_caryotype
+
+
+class Dictionnaire:
+    """Interne des chaînes: chaque valeur distincte reçoit un code entier."""
+    __slots__ = ('valeurs', 'codes')
+
+    def __init__(self):
+        self.valeurs = []
+        self.codes = {}
+
+    def __len__(self):
+        return len(self.valeurs)
+
+    def code(self, valeur):
+        c = self.codes.get(valeur)
+        if c is None:
+            c = self.codes[valeur] = len(self.valeurs)
+            self.valeurs.append(valeur)
+        return c
+
+
+class TableAnomalies:
+    """
+    Résultats au niveau anomalie, en colonnes:
+
+    - formule : position de la formule dans le lot / fichier (0 = première)
+    - clone : numéro du clone (1 = premier clone de la formule); les
+      lignées secondaires ("idem", "sl", "sdl") ont aussi une ligne par
+      anomalie héritée, si le texte des formules est fourni
+    - anomalie, type, explication : codes dans les dictionnaires du même nom
+    - chromosomes : masque des chromosomes impliqués (cf. masque_chromosomes)
+    - occurrences : nombre d'occurrences de l'anomalie dans la formule
+    - occurrences_clone : nombre d'occurrences dans le clone, héritées
+      comprises (+8,+8 ou 47,XX,+8/48,idem,+8)
+    - score_jondreville, score_iscn : scores de l'anomalie
+    - premier_clone : 1 sur la première ligne de l'anomalie dans la formule
+      (une anomalie présente dans plusieurs clones n'est scorée qu'une fois:
+      les totaux par formule sont les sommes sur premier_clone == 1)
+    """
+    # Colonnes et type des tableaux (entiers 32 bits, scores sur 8 bits)
+    COLONNES = (
+        ('formule', 'i'), ('clone', 'i'), ('anomalie', 'i'), ('type', 'i'),
+        ('explication', 'i'), ('chromosomes', 'i'), ('occurrences', 'i'), ('occurrences_clone', 'i'),
+        ('score_jondreville', 'b'), ('score_iscn', 'b'), ('premier_clone', 'b'),
+    )
+    DICTIONNAIRES = ('anomalie', 'type', 'explication')
+
+    def __init__(self):
+        self.colonnes = {nom: array(code) for nom, code in self.COLONNES}
+        self.dictionnaires = {nom: Dictionnaire() for nom in self.DICTIONNAIRES}
+        # Masque des chromosomes par code d'anomalie
+        self.masques = array('i')
+        # "clone1, clone1, clone3" -> ((1, 2), (3, 1)): (numéro, occurrences)
+        self._clones = {}
+        # Texte de formule -> anomalies par clone, héritées comprises (cf. _clones_herites)
+        self._heritees = {}
+
+    def __len__(self):
+        return len(self.colonnes['formule'])
+
+    def _numeros_clones(self, clones):
+        numeros = self._clones.get(clones)
+        if numeros is None:
+            # Dédoublonnés en conservant l'ordre, avec le nombre d'occurrences
+            occurrences = {}
+            for c in clones.split(', '):
+                if c.startswith('clone') and c[5:].isdigit():
+                    n = int(c[5:])
+                    occurrences[n] = occurrences.get(n, 0) + 1
+            # Clones inconnus: (0, 0), occurrences de la formule
+            numeros = tuple(occurrences.items()) or ((0, 0),)
+            self._clones[clones] = numeros
+        return numeros
+
+    def _clones_herites(self, texte):
+        """
+        {anomalie: [(numéro, occurrences), ...]} des clones de la formule
+        ``texte``, anomalies héritées comprises (cf.
+        Caryotype.anomalies_clone), ou None sans lignée secondaire.
+        """
+        if not isinstance(texte, str) or '/' not in texte or 'idem' not in texte and 'sl' not in texte:
+            return None
+        if texte in self._heritees:
+            return self._heritees[texte]
+        caryotype = parser_caryotype(texte)
+        if all(clone.parent is None for clone in caryotype.clones):
+            self._heritees[texte] = None
+            return None
+        par_anomalie = self._heritees[texte] = {}
+        for clone in caryotype.clones:
+            occurrences = {}
+            for position in caryotype.anomalies_clone(clone.numero):
+                anomalie = caryotype.anomalies[position]
+                occurrences[anomalie] = occurrences.get(anomalie, 0) + 1
+            for anomalie, n in occurrences.items():
+                par_anomalie.setdefault(anomalie, []).append((clone.numero, n))
+        return par_anomalie
+
+    def ajouter(self, formule, lignes, texte=None):
+        """
+        Ajoute les LigneAnomalie de la formule ``formule``; avec ``texte``
+        (formule ISCN), les anomalies héritées des lignées secondaires sont
+        ajoutées à leurs clones.
+        """
+        heritees = self._clones_herites(texte) if texte is not None else None
+        col = self.colonnes
+        anomalies = self.dictionnaires['anomalie']
+        types = self.dictionnaires['type']
+        explications = self.dictionnaires['explication']
+        masques = self.masques
+        # Méthodes d'ajout liées une fois par formule (boucle interne chaude)
+        (ajout_formule, ajout_clone, ajout_anomalie, ajout_type, ajout_explication, ajout_chromosomes,
+         ajout_occurrences, ajout_occurrences_clone, ajout_jondreville, ajout_iscn, ajout_premier) = (
+            col[nom].append for nom, _ in self.COLONNES
+        )
+        for ligne in lignes:
+            code_anomalie = anomalies.code(ligne.anomalie)
+            if code_anomalie == len(masques):
+                masques.append(masque_chromosomes(ligne.anomalie))
+            masque = masques[code_anomalie]
+            code_type = types.code(ligne.type)
+            code_explication = explications.code(ligne.explication)
+            # Clones dédoublonnés en conservant l'ordre
+            premier = True
+            numeros = heritees.get(ligne.anomalie) if heritees else None
+            for clone, occurrences in numeros or self._numeros_clones(ligne.clones):
+                ajout_formule(formule)
+                ajout_clone(clone)
+                ajout_anomalie(code_anomalie)
+                ajout_type(code_type)
+                ajout_explication(code_explication)
+                ajout_chromosomes(masque)
+                ajout_occurrences(ligne.occurrences)
+                ajout_occurrences_clone(occurrences or ligne.occurrences)
+                ajout_jondreville(ligne.score_jondreville)
+                ajout_iscn(ligne.score_iscn)
+                ajout_premier(premier)
+                premier = False
+
+    def ajouter_lot(self, lot, debut=0, formules=None):
+        """
+        Ajoute un ResultatLot; ``debut`` est la position de sa première
+        formule, ``formules`` leur texte (anomalies héritées, cf. ajouter).
+        """
+        for i in range(len(lot)):
+            if lot.erreurs[i] is None:
+                self.ajouter(debut + i, lot.anomalies(i), formules[i] if formules is not None else None)
+
+    @classmethod
+    def depuis_lot(cls, lot, debut=0, formules=None):
+        table = cls()
+        table.ajouter_lot(lot, debut, formules)
+        return table
+
+    def valeurs(self, nom):
+        """Valeurs décodées d'une colonne (chaînes pour les colonnes internées)."""
+        colonne = self.colonnes[nom]
+        if nom in self.dictionnaires:
+            dictionnaire = self.dictionnaires[nom].valeurs
+            return [dictionnaire[c] for c in colonne]
+        return list(colonne)
+
+    def to_arrow(self):
+        """
+        pyarrow.Table sans copie des colonnes entières (tampons partagés
+        avec les tableaux ``array``); les colonnes internées sont des
+        DictionaryArray.
+        """
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("La conversion Arrow nécessite le paquet 'pyarrow'.") from e
+        types = {'i': pa.int32(), 'b': pa.int8()}
+        n = len(self)
+        colonnes = {}
+        for nom, code in self.COLONNES:
+            valeurs = pa.Array.from_buffers(types[code], n, [None, pa.py_buffer(self.colonnes[nom])])
+            if nom in self.dictionnaires:
+                valeurs = pa.DictionaryArray.from_arrays(
+                    valeurs, pa.array(self.dictionnaires[nom].valeurs, type=pa.string())
+                )
+            colonnes[nom] = valeurs
+        return pa.table(colonnes)
+
+    def to_dataframe(self):
+        """DataFrame pandas (colonnes internées en Categorical, sans copie des codes)."""
+        import numpy as np
+        import pandas as pd
+        dtypes = {'i': np.int32, 'b': np.int8}
+        donnees = {}
+        for nom, code in self.COLONNES:
+            valeurs = np.frombuffer(self.colonnes[nom], dtype=dtypes[code]) if len(self) else np.empty(0, dtypes[code])
+            if nom in self.dictionnaires:
+                valeurs = pd.Categorical.from_codes(valeurs, categories=self.dictionnaires[nom].valeurs)
+            donnees[nom] = valeurs
+        return pd.DataFrame(donnees)
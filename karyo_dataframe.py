@@ -0,0 +1,42 @@
+"""
+Adaptateurs pandas du moteur de scoring.
+
+Le moteur (My_expert_karyo_functions) n'importe pas pandas: les fonctions
+renvoyant des DataFrame passent par ce module, chargé à la première
+utilisation. Les processus de calcul et les scripts courts qui ne
+manipulent que des ResultatLot démarrent ainsi sans pandas.
+"""
+from array import array
+
+import pandas as pd
+
+from My_expert_karyo_functions import COLONNES
+
+
+def dataframe_formule(lignes, total_j, total_i):
+    """DataFrame d'une formule (LigneAnomalie), avec la ligne de totaux."""
+    rows = [dict(zip(COLONNES, ligne)) for ligne in lignes]
+    rows.append({
+        "Anomalie": "TOTAL",
+        "Type": "",
+        "Explication": "",
+        "Occurrences": "",
+        "Clones": "",
+        "Score Jondreville 2020": total_j,
+        "Score ISCN 2024": total_i,
+    })
+    return pd.DataFrame(rows)
+
+
+def dataframe_lot(lot):
+    """
+    DataFrame unique d'un ResultatLot (une ligne par anomalie), avec la
+    position de la formule d'origine dans la colonne "Index formule".
+    """
+    index = array('l')
+    for i in range(len(lot)):
+        fin = lot.debuts[i + 1] if i + 1 < len(lot.debuts) else len(lot.lignes)
+        index.extend([i] * (fin - lot.debuts[i]))
+    df = pd.DataFrame.from_records(lot.lignes, columns=COLONNES)
+    df.insert(0, "Index formule", index)
+    return df
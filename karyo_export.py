@@ -0,0 +1,159 @@
+import csv
+import io
+import math
+import openpyxl
+import pandas as pd
+from My_expert_karyo_functions import COLONNES
+
+# Colonnes de l'export détaillé (une ligne par anomalie)
+COLONNES_ANOMALIES = ["Ligne", "Formule"] + COLONNES
+
+# Types Parquet stables d'un paquet à l'autre ("Erreur" -> valeur manquante)
+_TYPES_PARQUET = {
+    "Formule": "string",
+    "Comptage automatique": "Int64",
+    "Comptage manuel": "Float64",
+    "Erreur": "string",
+}
+
+# Nombre de lignes écrites à la fois en Parquet
+TAILLE_PAQUET = 50000
+
+
+def _valeurs(ligne, colonnes):
+    """Valeurs d'une ligne (dict ou séquence), NaN remplacés par None."""
+    if isinstance(ligne, dict):
+        ligne = [ligne.get(c) for c in colonnes]
+    return [None if isinstance(v, float) and math.isnan(v) else v for v in ligne]
+
+
+def lignes_anomalies(results, details):
+    """
+    Lignes de l'export détaillé à partir des résultats par formule et des
+    détails d'anomalies correspondants ({"error", "lignes"|"message"}).
+    """
+    for row, detail in zip(results, details):
+        if detail["error"]:
+            continue
+        for ligne in detail["lignes"]:
+            yield (row["Ligne"], row["Formule"], *ligne)
+
+
+# CSV: écriture ligne à ligne
+def ecrire_csv(colonnes, lignes, destination):
+    """Écrit ``lignes`` en CSV (UTF-8) dans un chemin ou un fichier binaire."""
+    if isinstance(destination, (str, bytes)) or hasattr(destination, '__fspath__'):
+        with open(destination, 'w', newline='', encoding='utf-8') as f:
+            _ecrire_csv(colonnes, lignes, f)
+    else:
+        texte = io.TextIOWrapper(destination, encoding='utf-8', newline='')
+        try:
+            _ecrire_csv(colonnes, lignes, texte)
+        finally:
+            texte.detach()
+
+
+def _ecrire_csv(colonnes, lignes, f):
+    writer = csv.writer(f)
+    writer.writerow(colonnes)
+    for ligne in lignes:
+        writer.writerow(_valeurs(ligne, colonnes))
+    f.flush()
+
+
+# Excel: classeur en mode écriture seule (pas de modèle objet en mémoire)
+def ecrire_xlsx(feuilles, destination):
+    """
+    Écrit un classeur Excel en mode write-only.
+    ``feuilles``: liste de (nom, colonnes, lignes).
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    for nom, colonnes, lignes in feuilles:
+        ws = wb.create_sheet(nom)
+        ws.append(colonnes)
+        for ligne in lignes:
+            ws.append(_valeurs(ligne, colonnes))
+    wb.save(destination)
+
+
+# Parquet: écriture par paquets (nécessite pyarrow)
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("L'export Parquet nécessite le paquet 'pyarrow'.") from e
+    return pa, pq
+
+
+def parquet_disponible():
+    """Vrai si pyarrow est installé."""
+    try:
+        _pyarrow()
+    except ImportError:
+        return False
+    return True
+
+
+def ajouter_paquet_parquet(df, destination, writer=None):
+    """
+    Ajoute un DataFrame au fichier Parquet ``destination``.
+    Le schéma est fixé par le premier paquet; renvoie le writer à réutiliser
+    (et à fermer) pour les paquets suivants.
+    """
+    pa, pq = _pyarrow()
+    for col, dtype in _TYPES_PARQUET.items():
+        if col in df.columns:
+            if dtype == "string":
+                df[col] = df[col].astype(dtype)
+            else:
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if writer is None:
+        writer = pq.ParquetWriter(destination, table.schema)
+    else:
+        table = table.cast(writer.schema)
+    writer.write_table(table)
+    return writer
+
+
+def ajouter_table_parquet(table, destination, writer=None):
+    """
+    Ajoute une TableAnomalies (format long, colonnes internées) au fichier
+    Parquet ``destination``; renvoie le writer comme ajouter_paquet_parquet.
+    """
+    pa, pq = _pyarrow()
+    donnees = table.to_arrow()
+    if writer is None:
+        writer = pq.ParquetWriter(destination, donnees.schema)
+    writer.write_table(donnees)
+    return writer
+
+
+def ecrire_table_parquet(table, destination):
+    """Écrit une TableAnomalies en Parquet."""
+    ajouter_table_parquet(table, destination).close()
+
+
+def ecrire_parquet(colonnes, lignes, destination, taille_paquet=TAILLE_PAQUET):
+    """Écrit ``lignes`` en Parquet, par paquets de ``taille_paquet`` lignes."""
+    writer = None
+    paquet = []
+    try:
+        for ligne in lignes:
+            paquet.append(_valeurs(ligne, colonnes))
+            if len(paquet) >= taille_paquet:
+                writer = ajouter_paquet_parquet(pd.DataFrame(paquet, columns=colonnes), destination, writer)
+                paquet = []
+        if paquet or writer is None:
+            writer = ajouter_paquet_parquet(pd.DataFrame(paquet, columns=colonnes), destination, writer)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def en_octets(ecrire, *args):
+    """Contenu (bytes) produit par une fonction d'écriture ci-dessus."""
+    tampon = io.BytesIO()
+    ecrire(*args, tampon)
+    return tampon.getvalue()
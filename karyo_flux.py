@@ -0,0 +1,309 @@
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import multiprocessing
+import numbers
+import pandas as pd
+from My_expert_karyo_functions import ResultatLot, analyser_lot, analyser_lot_parallele
+from karyo_colonnes import TableAnomalies
+from karyo_export import ajouter_paquet_parquet, ajouter_table_parquet
+from karyo_instrumentation import INSTRUMENTATION
+from karyo_xlsx import derniere_ligne_xlsx, lire_colonnes_xlsx
+
+# Nombre de formules lues, analysées et écrites à la fois
+TAILLE_CHUNK = 10000
+
+
+class ColonneFormuleManquante(ValueError):
+    """Le fichier ne contient pas de colonne 'Formule'."""
+
+    def __init__(self):
+        super().__init__("Le fichier doit contenir au moins une colonne 'Formule'.")
+
+
+def est_colonne_formule(col):
+    """Colonne 'Formule', reconnue de manière insensible à la casse."""
+    return str(col).strip().lower() == 'formule'
+
+
+def cle_cellule(valeur):
+    """
+    Valeur d'une cellule utilisable comme clé (empreinte de ligne, formule
+    déjà analysée): les cellules vides (None, NaN) valent None.
+    """
+    if valeur is None or valeur != valeur:
+        return None
+    return valeur
+
+
+def comptage_numerique(valeur):
+    """
+    Comptage manuel en nombre (texte "1" compris, comme pd.to_numeric), ou
+    None pour une cellule vide ou non numérique.
+    """
+    if isinstance(valeur, str):
+        try:
+            return float(valeur)
+        except ValueError:
+            return None
+    if isinstance(valeur, numbers.Real) and valeur == valeur:
+        return valeur
+    return None
+
+
+def _nom_source(source):
+    """Nom (ou chemin) d'une source: chemin ou fichier chargé (attribut name)."""
+    return str(getattr(source, 'name', source))
+
+
+# Lecture par paquets de la colonne Formule (et Count si présente)
+def lire_formules(source, taille_chunk=TAILLE_CHUNK):
+    """
+    Générateur de paquets (formules, counts) lus depuis un CSV ou un Excel.
+    ``counts`` vaut None si le fichier n'a pas de colonne 'Count'.
+    Seules ces deux colonnes sont lues; la mémoire reste bornée par
+    ``taille_chunk`` quelle que soit la taille du fichier.
+    Lève ColonneFormuleManquante si aucune colonne 'Formule' n'est trouvée.
+    """
+    nom = _nom_source(source).lower()
+    if nom.endswith('.csv'):
+        yield from _lire_csv(source, taille_chunk)
+    elif nom.endswith('.xls'):
+        yield from _lire_xls(source, taille_chunk)
+    else:
+        yield from _lire_xlsx(source, taille_chunk)
+
+
+def estimer_nb_lignes(source):
+    """
+    Nombre approximatif de lignes de données (pour le suivi de
+    progression), ou None s'il n'est pas connu sans tout lire.
+    CSV: nombre de fins de ligne; Excel: dimension déclarée de la feuille.
+    """
+    nom = _nom_source(source).lower()
+    try:
+        if nom.endswith('.csv'):
+            if hasattr(source, 'getbuffer'):
+                contenu = bytes(source.getbuffer())
+            else:
+                with open(source, 'rb') as f:
+                    contenu = f.read()
+            return max(contenu.count(b'\n') - 1 + (not contenu.endswith(b'\n')), 0)
+        if nom.endswith('.xlsx'):
+            derniere = derniere_ligne_xlsx(source)
+            return max(derniere - 1, 0) if derniere else None
+    except Exception:
+        return None
+    finally:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+    return None
+
+
+def _lire_csv(source, taille_chunk):
+    lecteur = pd.read_csv(
+        source,
+        chunksize=taille_chunk,
+        usecols=lambda c: est_colonne_formule(c) or c == 'Count',
+    )
+    for chunk in lecteur:
+        formule_col = next((c for c in chunk.columns if est_colonne_formule(c)), None)
+        if formule_col is None:
+            raise ColonneFormuleManquante()
+        counts = chunk['Count'].tolist() if 'Count' in chunk.columns else None
+        yield chunk[formule_col].tolist(), counts
+
+
+def _lire_xlsx(source, taille_chunk):
+    # Lecture en flux des seules colonnes Formule et Count (cf. karyo_xlsx)
+    avec_count = False
+
+    def selectionner(entete):
+        nonlocal avec_count
+        idx_formule = next((i for i, c in enumerate(entete) if est_colonne_formule(c)), None)
+        if idx_formule is None:
+            raise ColonneFormuleManquante()
+        idx_count = next((i for i, c in enumerate(entete) if c == 'Count'), None)
+        avec_count = idx_count is not None
+        return (idx_formule, idx_count) if avec_count else (idx_formule,)
+
+    formules, counts = [], []
+    for ligne in lire_colonnes_xlsx(source, selectionner):
+        formule = ligne[0]
+        count = ligne[1] if avec_count else None
+        # Formule vide: ligne gardée (erreur), numérotée comme en CSV
+        formules.append(formule)
+        counts.append(count)
+        if len(formules) >= taille_chunk:
+            yield formules, counts if avec_count else None
+            formules, counts = [], []
+    if formules:
+        yield formules, counts if avec_count else None
+
+
+def _lire_xls(source, taille_chunk):
+    # Ancien format binaire: pas de lecture en flux possible, projection seule
+    df = pd.read_excel(source, usecols=lambda c: est_colonne_formule(c) or c == 'Count')
+    formule_col = next((c for c in df.columns if est_colonne_formule(c)), None)
+    if formule_col is None:
+        raise ColonneFormuleManquante()
+    for debut in range(0, len(df), taille_chunk):
+        chunk = df.iloc[debut:debut + taille_chunk]
+        counts = chunk['Count'].tolist() if 'Count' in chunk.columns else None
+        yield chunk[formule_col].tolist(), counts
+
+
+# Analyse en flux
+def _analyser_paquet(formules, workers, executor, reference):
+    """
+    ResultatLot d'un paquet; les formules présentes dans ``reference``
+    (cf. analyser_flux) sont reprises sans être réanalysées.
+    """
+    if reference is None:
+        a_analyser = formules
+    else:
+        lot_reference, positions = reference
+        a_analyser = [f for f in formules if cle_cellule(f) not in positions]
+        if len(a_analyser) == len(formules):
+            reference = None
+    if not a_analyser:
+        analyses = None
+    elif workers > 1:
+        analyses = analyser_lot_parallele(a_analyser, workers=workers, executor=executor)
+    else:
+        analyses = analyser_lot(a_analyser)
+    if reference is None:
+        return analyses if analyses is not None else analyser_lot(())
+
+    lot = ResultatLot()
+    j = 0
+    for formule in formules:
+        position = positions.get(cle_cellule(formule))
+        if position is not None:
+            lot.reprendre(lot_reference, position)
+        else:
+            lot.reprendre(analyses, j)
+            j += 1
+    return lot
+
+
+def analyser_flux(source, workers=1, taille_chunk=TAILLE_CHUNK, reference=None):
+    """
+    Générateur de paquets analysés: (debut, formules, counts, lot), où
+    ``debut`` est la position de la première formule du paquet dans le
+    fichier et ``lot`` le ResultatLot correspondant.
+    ``reference`` : résultats déjà calculés, (ResultatLot, {cle_cellule:
+    position dans ce lot}); les formules qui y figurent sont reprises sans
+    être réanalysées.
+    Le pool de processus (``workers`` > 1) n'est ouvert que pour un fichier
+    de plusieurs paquets; un paquet unique est confié à
+    analyser_lot_parallele, qui l'analyse sur place s'il est petit.
+    """
+    debut = 0
+    executor = None
+    try:
+        paquets = lire_formules(source, taille_chunk)
+        if workers > 1:
+            with INSTRUMENTATION.mesurer("lecture"):
+                premiers = list(itertools.islice(paquets, 2))
+            paquets = itertools.chain(premiers, paquets)
+            if len(premiers) > 1:
+                # forkserver: pas de fork depuis un thread (cf. TraitementFichier)
+                # qui pourrait hériter d'un verrou tenu par un autre thread
+                executor = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context("forkserver")
+                )
+        while True:
+            with INSTRUMENTATION.mesurer("lecture"):
+                paquet = next(paquets, None)
+            if paquet is None:
+                break
+            formules, counts = paquet
+            lot = _analyser_paquet(formules, workers, executor, reference)
+            yield debut, formules, counts, lot
+            debut += len(formules)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def lignes_resultats(formules, counts, lot, debut=0, detail_anomalies=True):
+    """
+    Lignes de résultats (une par formule) au format de l'onglet
+    "Analyse d'un fichier": Ligne, Formule, Comptage automatique,
+    Anomalies détectées, et Comptage manuel / Correspondance si ``counts``
+    (comptage manuel comparé en nombre, cf. comptage_numerique: même
+    définition que karyo_cohorte.concordance).
+    Sans ``detail_anomalies``, la colonne texte "Anomalies détectées"
+    n'est pas construite et est remplacée par "Erreur" (message ou None);
+    le détail est alors à prendre dans une TableAnomalies.
+    """
+    has_count = counts is not None
+    for i, formule in enumerate(formules):
+        error = lot.erreurs[i]
+        count_auto = lot.totaux_iscn[i]
+        count_manuel = counts[i] if has_count else None
+        if error:
+            anomalies_detail = error
+            match = "❌" if has_count else "N/A"
+        else:
+            if detail_anomalies:
+                anomalies_detail = ", ".join([
+                    f"{ligne.anomalie} ({ligne.type}): {ligne.score_iscn} pts"
+                    for ligne in lot.anomalies(i)
+                ])
+            match = (
+                "N/A" if not has_count
+                else "✅" if comptage_numerique(count_manuel) == count_auto else "❌"
+            )
+
+        result_row = {
+            "Ligne": debut + i + 1,
+            "Formule": formule,
+            "Comptage automatique": count_auto if not error else "Erreur",
+        }
+        if detail_anomalies:
+            result_row["Anomalies détectées"] = anomalies_detail
+        else:
+            result_row["Erreur"] = error
+        if has_count:
+            result_row["Comptage manuel"] = count_manuel
+            result_row["Correspondance"] = match
+        yield result_row
+
+
+# Écriture incrémentale
+def ecrire_resultats(source, destination, workers=1, taille_chunk=TAILLE_CHUNK, anomalies=None):
+    """
+    Analyse ``source`` en flux et écrit les résultats au fur et à mesure
+    dans ``destination`` (.csv ou .parquet, selon l'extension).
+    Si ``anomalies`` est un chemin, le détail des anomalies y est écrit en
+    Parquet au format long (TableAnomalies) au lieu de la colonne texte
+    "Anomalies détectées".
+    Renvoie le nombre de formules traitées.
+    """
+    parquet = str(destination).lower().endswith('.parquet')
+    writer = None
+    writer_anomalies = None
+    total = 0
+    try:
+        for debut, formules, counts, lot in analyser_flux(source, workers, taille_chunk):
+            with INSTRUMENTATION.mesurer("ecriture"):
+                df = pd.DataFrame(list(
+                    lignes_resultats(formules, counts, lot, debut, detail_anomalies=anomalies is None)
+                ))
+                if anomalies is not None:
+                    writer_anomalies = ajouter_table_parquet(
+                        TableAnomalies.depuis_lot(lot, debut, formules), anomalies, writer_anomalies
+                    )
+                if parquet:
+                    writer = ajouter_paquet_parquet(df, destination, writer)
+                else:
+                    df.to_csv(destination, mode='w' if debut == 0 else 'a',
+                              header=debut == 0, index=False)
+            total += len(formules)
+    finally:
+        if writer is not None:
+            writer.close()
+        if writer_anomalies is not None:
+            writer_anomalies.close()
+    return total
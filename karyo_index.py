@@ -0,0 +1,187 @@
+"""
+Index inversé d'une cohorte scorée, pour les requêtes par chromosome,
+type d'anomalie, anomalie et score.
+
+Construit sur une TableAnomalies (une ligne par formule, clone et
+anomalie), sans relire le texte des formules: les critères portant sur
+une anomalie (chromosomes impliqués, type, opérateur, texte) sont évalués
+une fois par entrée du dictionnaire des anomalies, puis les formules ou
+clones concernés sont lus dans les listes inversées (lignes de la table
+triées par anomalie). Les résultats sont des tableaux numpy de booléens
+par formule, que l'on combine avec & | ~:
+
+    index = IndexCohorte(table)
+    der7 = index.formules(index.anomalies(chromosomes="7", operateurs=("der", "dic")))
+    perte5 = index.formules(index.anomalies(noms="-5") | index.anomalies(motif=r"del\\(5\\)\\(q"))
+    positions = np.flatnonzero(der7 & perte5)
+"""
+import re
+
+import numpy as np
+
+from My_expert_karyo_functions import bits_chromosomes, tokeniser_anomalie
+
+
+def _colonne(table, nom, dtype):
+    colonne = table.colonnes[nom]
+    return np.frombuffer(colonne, dtype=dtype) if len(colonne) else np.empty(0, dtype)
+
+
+class IndexCohorte:
+    """
+    Index d'une TableAnomalies de ``nb_formules`` formules (par défaut:
+    jusqu'à la dernière formule de la table).
+
+    - masques / types : masque des chromosomes et code de type (dictionnaire
+      "type" de la table) par code d'anomalie
+    - chromosomes_formules : masque des chromosomes impliqués par formule
+    - scores : total ISCN 2024 par formule (``scores`` fourni, sinon somme
+      des scores de la table: 0 pour une formule sans anomalie ou en erreur)
+    - listes inversées : lignes de la table triées par code d'anomalie
+      (debuts[code]:debuts[code + 1])
+    """
+
+    def __init__(self, table, nb_formules=None, scores=None):
+        self.table = table
+        formule = _colonne(table, 'formule', np.int32)
+        anomalie = _colonne(table, 'anomalie', np.int32)
+        chromosomes = _colonne(table, 'chromosomes', np.int32)
+        if nb_formules is None:
+            nb_formules = int(formule.max()) + 1 if len(formule) else 0
+        self.nb_formules = nb_formules
+        self.noms = table.dictionnaires['anomalie'].valeurs
+        nb_anomalies = len(self.noms)
+
+        self.masques = np.frombuffer(table.masques, dtype=np.int32)[:nb_anomalies].copy()
+        self.types = np.zeros(nb_anomalies, dtype=np.int32)
+        self.types[anomalie] = _colonne(table, 'type', np.int32)
+        self._operateurs = None
+
+        # Masque des chromosomes par formule (OU sur les lignes de chaque
+        # formule, contiguës dans l'ordre d'ajout à la table)
+        self.chromosomes_formules = np.zeros(nb_formules, dtype=np.int32)
+        if len(formule):
+            f, c = formule, chromosomes
+            if np.any(f[1:] < f[:-1]):
+                ordre = np.argsort(f, kind='stable')
+                f, c = f[ordre], c[ordre]
+            groupes = np.flatnonzero(np.r_[True, f[1:] != f[:-1]])
+            self.chromosomes_formules[f[groupes]] = np.bitwise_or.reduceat(c, groupes)
+
+        if scores is not None:
+            self.scores = np.asarray(scores, dtype=float)
+        else:
+            premier = _colonne(table, 'premier_clone', np.int8).astype(bool)
+            self.scores = np.bincount(
+                formule[premier], weights=_colonne(table, 'score_iscn', np.int8)[premier],
+                minlength=nb_formules,
+            )
+
+        # Listes inversées: anomalie -> lignes (formule, clone, occurrences)
+        ordre = np.argsort(anomalie, kind='stable')
+        self._formule = formule[ordre]
+        self._clone = _colonne(table, 'clone', np.int32)[ordre]
+        self._occurrences = _colonne(table, 'occurrences', np.int32)[ordre]
+        self._occurrences_clone = _colonne(table, 'occurrences_clone', np.int32)[ordre]
+        self.debuts = np.searchsorted(anomalie[ordre], np.arange(nb_anomalies + 1))
+
+    def __len__(self):
+        return self.nb_formules
+
+    # Sélection d'anomalies (tableau de booléens par code d'anomalie)
+    def anomalies(self, chromosomes=None, tous=False, types=None, operateurs=None, noms=None, motif=None):
+        """
+        Anomalies distinctes de la cohorte satisfaisant tous les critères
+        donnés:
+        - chromosomes : chromosome(s) impliqué(s) ("7", ("5", "7"), "X"),
+          l'un d'eux ou, avec ``tous``, tous
+        - types : type(s) d'affichage ("Translocation déséquilibrée"); un
+          type en " chr" désigne tous les gains ou pertes ("Gain chr")
+        - operateurs : opérateur(s) de tête (cf. Anomalie.operateur: "der",
+          "del", "t", "+", "-"...)
+        - noms : anomalie(s) exacte(s), éventuellement précédée(s) de '?' ("+8", "-5")
+        - motif : expression régulière cherchée en début d'anomalie
+        """
+        selection = np.ones(len(self.noms), dtype=bool)
+        if chromosomes is not None:
+            masque = bits_chromosomes(chromosomes)
+            communs = self.masques & masque
+            selection &= communs == masque if tous else communs != 0
+        if types is not None:
+            types = (types,) if isinstance(types, str) else tuple(types)
+            prefixes = tuple(t for t in types if t.endswith(" chr"))
+            codes = [
+                c for c, v in enumerate(self.table.dictionnaires['type'].valeurs)
+                if v in types or (prefixes and v.startswith(prefixes))
+            ]
+            selection &= np.isin(self.types, codes)
+        if operateurs is not None:
+            operateurs = (operateurs,) if isinstance(operateurs, str) else tuple(operateurs)
+            selection &= np.isin(self.operateurs(), operateurs)
+        if noms is not None:
+            noms = (noms,) if isinstance(noms, str) else tuple(noms)
+            codes = self.table.dictionnaires['anomalie'].codes
+            retenues = np.zeros(len(self.noms), dtype=bool)
+            retenues[[c for n in noms for c in (codes.get(n), codes.get('?' + n)) if c is not None]] = True
+            selection &= retenues
+        if motif is not None:
+            expression = re.compile(motif)
+            selection &= np.fromiter(
+                (expression.match(n.lstrip('?')) is not None for n in self.noms), dtype=bool, count=len(self.noms)
+            )
+        return selection
+
+    def operateurs(self):
+        """Opérateur de tête par code d'anomalie (calculé à la première demande)."""
+        if self._operateurs is None:
+            self._operateurs = np.array([tokeniser_anomalie(n).operateur for n in self.noms], dtype=object)
+        return self._operateurs
+
+    def _lignes(self, selection):
+        """Positions (dans l'ordre des listes inversées) des lignes des anomalies sélectionnées."""
+        codes = np.flatnonzero(selection)
+        debuts = self.debuts[codes]
+        longueurs = self.debuts[codes + 1] - debuts
+        total = int(longueurs.sum())
+        if not total:
+            return np.empty(0, dtype=np.intp)
+        # Concaténation vectorisée des intervalles debuts[k]:debuts[k] + longueurs[k]
+        decalages = np.repeat(debuts - np.cumsum(longueurs) + longueurs, longueurs)
+        return decalages + np.arange(total)
+
+    # Résultats par formule / par clone
+    def formules(self, selection, occurrences_min=1):
+        """
+        Formules portant au moins une anomalie sélectionnée (au moins
+        ``occurrences_min`` fois dans la formule): booléens par formule.
+        """
+        lignes = self._lignes(selection)
+        if occurrences_min > 1:
+            lignes = lignes[self._occurrences[lignes] >= occurrences_min]
+        resultat = np.zeros(self.nb_formules, dtype=bool)
+        resultat[self._formule[lignes]] = True
+        return resultat
+
+    def clones(self, selection, occurrences_min=1):
+        """
+        Clones portant une anomalie sélectionnée, écrite au moins
+        ``occurrences_min`` fois dans le clone (ex. tétrasomie: "+8",
+        occurrences_min=2; anomalies héritées par "idem", "sl" ou "sdl"
+        comprises si la table a été construite avec le texte des formules).
+        Renvoie un tableau (n, 2) de (formule, clone), trié.
+        """
+        lignes = self._lignes(selection)
+        if occurrences_min > 1:
+            lignes = lignes[self._occurrences_clone[lignes] >= occurrences_min]
+        paires = np.stack([self._formule[lignes], self._clone[lignes]], axis=1)
+        return np.unique(paires, axis=0) if len(paires) else paires
+
+    def chromosomes(self, chromosomes, tous=False):
+        """Formules dont une anomalie implique l'un (ou ``tous``) des chromosomes."""
+        masque = bits_chromosomes(chromosomes)
+        communs = self.chromosomes_formules & masque
+        return communs == masque if tous else communs != 0
+
+    def score_min(self, seuil):
+        """Formules de score ISCN 2024 supérieur ou égal à ``seuil``."""
+        return self.scores >= seuil
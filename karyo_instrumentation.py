@@ -0,0 +1,102 @@
+import heapq
+import json
+import threading
+import time
+
+# Horloge utilisée par toutes les mesures
+horloge = time.perf_counter
+
+
+class Instrumentation:
+    """
+    Compteurs et temps cumulés par étape du pipeline d'analyse, plus les
+    formules les plus lentes à scorer.
+
+    Désactivée par défaut: le code instrumenté ne teste que ``actif`` et
+    n'appelle l'horloge que lorsqu'elle est activée. Les étapes exécutées
+    dans les processus d'un pool ne sont pas remontées au processus parent.
+    """
+
+    def __init__(self, nb_plus_lentes=10):
+        self.actif = False
+        self.nb_plus_lentes = nb_plus_lentes
+        self._verrou = threading.Lock()
+        self.reinitialiser()
+
+    def activer(self, reinitialiser=True):
+        if reinitialiser:
+            self.reinitialiser()
+        self.actif = True
+
+    def desactiver(self):
+        self.actif = False
+
+    def reinitialiser(self):
+        with self._verrou:
+            self.compteurs = {}
+            self.durees = {}
+            self._plus_lentes = []
+
+    def ajouter(self, etape, duree, n=1):
+        """Ajoute ``n`` passages et ``duree`` secondes à ``etape``."""
+        with self._verrou:
+            self.compteurs[etape] = self.compteurs.get(etape, 0) + n
+            self.durees[etape] = self.durees.get(etape, 0.0) + duree
+
+    def formule(self, formule, duree):
+        """Enregistre la durée de scoring d'une formule (top des plus lentes)."""
+        with self._verrou:
+            entree = (duree, formule)
+            if len(self._plus_lentes) < self.nb_plus_lentes:
+                heapq.heappush(self._plus_lentes, entree)
+            elif entree > self._plus_lentes[0]:
+                heapq.heapreplace(self._plus_lentes, entree)
+
+    def mesurer(self, etape):
+        """Gestionnaire de contexte mesurant un bloc (pour le code peu fréquent)."""
+        return _Mesure(self, etape)
+
+    def rapport(self):
+        """Rapport sous forme de dict (sérialisable en JSON)."""
+        with self._verrou:
+            etapes = {
+                etape: {
+                    "passages": self.compteurs[etape],
+                    "duree_s": round(self.durees[etape], 6),
+                    "moyenne_us": round(self.durees[etape] / self.compteurs[etape] * 1e6, 3)
+                    if self.compteurs[etape] else 0.0,
+                }
+                for etape in self.compteurs
+            }
+            plus_lentes = [
+                {"formule": f, "duree_ms": round(d * 1e3, 3)}
+                for d, f in sorted(self._plus_lentes, reverse=True)
+            ]
+        return {"etapes": etapes, "plus_lentes": plus_lentes}
+
+    def json(self, **kwargs):
+        """Rapport au format JSON."""
+        return json.dumps(self.rapport(), ensure_ascii=False, **kwargs)
+
+
+class _Mesure:
+    __slots__ = ('instr', 'etape', 'debut')
+
+    def __init__(self, instr, etape):
+        self.instr = instr
+        self.etape = etape
+        self.debut = None
+
+    def __enter__(self):
+        if self.instr.actif:
+            self.debut = horloge()
+        return self
+
+    def __exit__(self, *exc):
+        if self.debut is not None:
+            self.instr.ajouter(self.etape, horloge() - self.debut)
+        return False
+
+
+# Instance partagée par le moteur, les scripts et l'application
+INSTRUMENTATION = Instrumentation()
@@ -0,0 +1,335 @@
+"""
+Analyse en ligne de commande de nombreux fichiers (CSV / Excel).
+
+Les fichiers sont lus par paquets (cf. lire_formules) et les paquets de
+tous les fichiers sont répartis sur un pool de processus; les résultats
+sont écrits dans l'ordre, fichier par fichier, dans le dossier de sortie:
+- <fichier>.resultats.csv et <fichier>.anomalies.csv
+- fusion.resultats.csv et fusion.anomalies.csv (colonne "Fichier" en tête)
+- synthese.csv : une ligne par fichier (effectifs, score moyen, concordance)
+
+L'avancement est enregistré après chaque paquet écrit (reprise.json): une
+exécution interrompue reprend là où elle s'était arrêtée. Un fichier
+source modifié depuis, ou un changement des règles de scoring
+(VERSION_REGLES), relance l'analyse du fichier depuis le début.
+
+Exemples:
+    python karyo_lots.py exports/ --sortie rapports
+    python karyo_lots.py "exports/**/*.xlsx" site_b.csv --sortie rapports --workers 8
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from My_expert_karyo_functions import VERSION_REGLES, analyser_lot
+from karyo_export import COLONNES_ANOMALIES, lignes_anomalies
+from karyo_flux import TAILLE_CHUNK, lignes_resultats, lire_formules
+from karyo_instrumentation import horloge
+
+EXTENSIONS = ('.csv', '.xlsx', '.xls')
+FICHIER_REPRISE = "reprise.json"
+
+# Colonnes des rapports fusionnés (fichiers avec et sans colonne Count)
+COLONNES_RESULTATS = [
+    "Ligne", "Formule", "Comptage automatique", "Anomalies détectées",
+    "Comptage manuel", "Correspondance",
+]
+
+
+def lister_fichiers(entrees):
+    """
+    Fichiers à analyser: chemins, dossiers (fichiers CSV / Excel qu'ils
+    contiennent) ou motifs glob ("**" récursif). Sans doublon, dans l'ordre
+    des entrées puis alphabétique.
+    """
+    fichiers = []
+    for entree in entrees:
+        if os.path.isdir(entree):
+            trouves = sorted(
+                os.path.join(entree, nom) for nom in os.listdir(entree)
+                if nom.lower().endswith(EXTENSIONS)
+            )
+        elif glob.has_magic(entree):
+            trouves = sorted(glob.glob(entree, recursive=True))
+        else:
+            trouves = [entree]
+        fichiers.extend(
+            os.path.abspath(f) for f in trouves
+            if f.lower().endswith(EXTENSIONS) and os.path.isfile(f)
+        )
+    return list(dict.fromkeys(fichiers))
+
+
+def _noms_sortie(fichiers):
+    """Préfixe des rapports de chaque fichier (nom sans extension, rendu unique)."""
+    noms = []
+    vus = {}
+    for fichier in fichiers:
+        nom = os.path.splitext(os.path.basename(fichier))[0]
+        n = vus.get(nom, 0)
+        vus[nom] = n + 1
+        noms.append(f"{nom}__{n + 1}" if n else nom)
+    return noms
+
+
+def _empreinte(fichier):
+    stat = os.stat(fichier)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class Reprise:
+    """
+    État d'avancement persistant (JSON dans le dossier de sortie), par
+    fichier source: lignes écrites, taille des rapports correspondante,
+    statistiques, fin ou erreur. Enregistré de manière atomique.
+    """
+
+    def __init__(self, sortie, recommencer=False):
+        self.chemin = os.path.join(sortie, FICHIER_REPRISE)
+        donnees = None
+        if not recommencer and os.path.exists(self.chemin):
+            with open(self.chemin, encoding='utf-8') as f:
+                donnees = json.load(f)
+            if donnees.get("version_regles") != VERSION_REGLES:
+                donnees = None
+        self.fichiers = donnees["fichiers"] if donnees else {}
+
+    def etat(self, fichier, nom):
+        """État du fichier, remis à zéro s'il est nouveau ou a changé."""
+        empreinte = _empreinte(fichier)
+        etat = self.fichiers.get(fichier)
+        if etat is None or etat["empreinte"] != empreinte or etat["nom"] != nom:
+            etat = self.fichiers[fichier] = {
+                "nom": nom,
+                "empreinte": empreinte,
+                "lignes": 0,
+                "octets": {"resultats": 0, "anomalies": 0},
+                "stats": {"erreurs": 0, "somme_scores": 0, "compares": 0, "concordants": 0},
+                "termine": False,
+                "erreur": None,
+            }
+        return etat
+
+    def enregistrer(self):
+        temporaire = self.chemin + ".tmp"
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump({"version_regles": VERSION_REGLES, "fichiers": self.fichiers}, f)
+        os.replace(temporaire, self.chemin)
+
+
+def _rapports(sortie, etat):
+    return {
+        "resultats": os.path.join(sortie, f"{etat['nom']}.resultats.csv"),
+        "anomalies": os.path.join(sortie, f"{etat['nom']}.anomalies.csv"),
+    }
+
+
+def _preparer_rapports(sortie, etat):
+    """
+    Ramène les rapports du fichier à la taille enregistrée (un paquet écrit
+    mais non enregistré dans la reprise est réécrit). Repart de zéro si un
+    rapport manque.
+    """
+    chemins = _rapports(sortie, etat)
+    for cle, chemin in chemins.items():
+        octets = etat["octets"][cle]
+        if not os.path.exists(chemin) or os.path.getsize(chemin) < octets:
+            etat["lignes"] = 0
+            etat["octets"] = {"resultats": 0, "anomalies": 0}
+            etat["stats"] = {"erreurs": 0, "somme_scores": 0, "compares": 0, "concordants": 0}
+            break
+    for cle, chemin in chemins.items():
+        if os.path.exists(chemin):
+            with open(chemin, 'r+b') as f:
+                f.truncate(etat["octets"][cle])
+
+
+def _paquets(etats, taille_chunk):
+    """
+    Paquets restant à analyser, tous fichiers confondus:
+    (etat, debut, formules, counts), puis (etat, None, None, erreur) en fin
+    de fichier (erreur: message, ou None).
+    """
+    for fichier, etat in etats:
+        if etat["termine"]:
+            continue
+        debut = 0
+        try:
+            for formules, counts in lire_formules(fichier, taille_chunk):
+                fin = debut + len(formules)
+                # Lignes déjà écrites lors d'une exécution précédente
+                deja = etat["lignes"] - debut
+                if deja >= len(formules):
+                    debut = fin
+                    continue
+                if deja > 0:
+                    formules = formules[deja:]
+                    counts = counts[deja:] if counts is not None else None
+                    debut += deja
+                yield etat, debut, formules, counts
+                debut = fin
+        except Exception as e:
+            yield etat, None, None, str(e)
+        else:
+            yield etat, None, None, None
+
+
+def _ecrire_paquet(sortie, etat, debut, formules, counts, lot):
+    """Ajoute un paquet analysé aux rapports du fichier et met à jour son état."""
+    chemins = _rapports(sortie, etat)
+    lignes = list(lignes_resultats(formules, counts, lot, debut))
+    details = [
+        {"error": True, "message": error} if error else {"error": False, "lignes": lot.anomalies(i)}
+        for i, error in enumerate(lot.erreurs)
+    ]
+    anomalies = list(lignes_anomalies(lignes, details))
+    for cle, df in (
+        ("resultats", pd.DataFrame(lignes)),
+        ("anomalies", pd.DataFrame(anomalies, columns=COLONNES_ANOMALIES)),
+    ):
+        premier = etat["octets"][cle] == 0
+        df.to_csv(chemins[cle], mode='w' if premier else 'a', header=premier, index=False)
+        etat["octets"][cle] = os.path.getsize(chemins[cle])
+
+    stats = etat["stats"]
+    for i, ligne in enumerate(lignes):
+        if lot.erreurs[i] is not None:
+            stats["erreurs"] += 1
+        else:
+            stats["somme_scores"] += lot.totaux_iscn[i]
+        # Correspondance de lignes_resultats: toutes les lignes comptent
+        # (Count vide = discordant), comme karyo_cohorte.concordance
+        if counts is not None:
+            stats["compares"] += 1
+            stats["concordants"] += ligne["Correspondance"] == "✅"
+    etat["lignes"] = debut + len(formules)
+
+
+def analyser_fichiers(fichiers, sortie, workers=None, taille_chunk=TAILLE_CHUNK,
+                      recommencer=False, journal=None):
+    """
+    Analyse ``fichiers`` et écrit les rapports dans ``sortie`` (cf. en-tête
+    du module). Reprend une exécution interrompue sauf si ``recommencer``.
+    ``journal(message)`` reçoit l'avancement.
+    Renvoie la Reprise finale (état de chaque fichier).
+    """
+    journal = journal or (lambda message: None)
+    os.makedirs(sortie, exist_ok=True)
+    reprise = Reprise(sortie, recommencer)
+    etats = [(f, reprise.etat(f, nom)) for f, nom in zip(fichiers, _noms_sortie(fichiers))]
+    for fichier, etat in etats:
+        if etat["termine"]:
+            journal(f"{fichier}: déjà analysé ({etat['lignes']} lignes)")
+        else:
+            _preparer_rapports(sortie, etat)
+            if etat["lignes"]:
+                journal(f"{fichier}: reprise après {etat['lignes']} lignes")
+    reprise.enregistrer()
+
+    workers = workers or os.cpu_count() or 1
+    debut_execution = horloge()
+    nb_lignes = 0
+
+    def ecrire_suivant(en_cours):
+        nonlocal nb_lignes
+        etat, debut, formules, counts, futur = en_cours.popleft()
+        if futur is None:
+            # Fin du fichier (counts: message d'erreur éventuel)
+            etat["termine"] = counts is None
+            etat["erreur"] = counts
+            reprise.enregistrer()
+            journal(f"{etat['nom']}: terminé, {etat['lignes']} lignes" if counts is None
+                    else f"{etat['nom']}: erreur après {etat['lignes']} lignes: {counts}")
+            return
+        _ecrire_paquet(sortie, etat, debut, formules, counts, futur.result())
+        reprise.enregistrer()
+        nb_lignes += len(formules)
+        journal(f"{etat['nom']}: {etat['lignes']} lignes "
+                f"({nb_lignes / (horloge() - debut_execution):.0f} lignes/s)")
+
+    # Paquets soumis, dans l'ordre d'écriture; au plus 2 en attente par processus
+    en_cours = deque()
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for etat, debut, formules, counts in _paquets(etats, taille_chunk):
+            futur = executor.submit(analyser_lot, formules) if formules is not None else None
+            en_cours.append((etat, debut, formules, counts, futur))
+            while len(en_cours) > 2 * workers or (en_cours and en_cours[0][4] is None):
+                ecrire_suivant(en_cours)
+        while en_cours:
+            ecrire_suivant(en_cours)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    ecrire_fusion(etats, sortie)
+    return reprise
+
+
+def ecrire_fusion(etats, sortie, taille_chunk=TAILLE_CHUNK):
+    """Rapports fusionnés des fichiers terminés et synthèse par fichier."""
+    for cle, colonnes in (("resultats", COLONNES_RESULTATS), ("anomalies", COLONNES_ANOMALIES)):
+        destination = os.path.join(sortie, f"fusion.{cle}.csv")
+        premier = True
+        for fichier, etat in etats:
+            if not etat["termine"] or not etat["octets"][cle]:
+                continue
+            for chunk in pd.read_csv(_rapports(sortie, etat)[cle], chunksize=taille_chunk, dtype=str):
+                chunk = chunk.reindex(columns=colonnes)
+                chunk.insert(0, "Fichier", fichier)
+                chunk.to_csv(destination, mode='w' if premier else 'a', header=premier, index=False)
+                premier = False
+        if premier:
+            pd.DataFrame(columns=["Fichier"] + colonnes).to_csv(destination, index=False)
+
+    synthese = []
+    for fichier, etat in etats:
+        stats = etat["stats"]
+        analyses = etat["lignes"] - stats["erreurs"]
+        synthese.append({
+            "Fichier": fichier,
+            "Statut": "terminé" if etat["termine"] else f"erreur: {etat['erreur']}" if etat["erreur"] else "interrompu",
+            "Formules": etat["lignes"],
+            "Erreurs": stats["erreurs"],
+            "Score ISCN 2024 moyen": round(stats["somme_scores"] / analyses, 3) if analyses else None,
+            "Comptages comparés": stats["compares"],
+            "Concordants": stats["concordants"],
+            "Concordance (%)": round(100 * stats["concordants"] / stats["compares"], 1) if stats["compares"] else None,
+        })
+    pd.DataFrame(synthese).to_csv(os.path.join(sortie, "synthese.csv"), index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Analyse par lots de fichiers de formules caryotypiques (CSV / Excel)"
+    )
+    parser.add_argument("entrees", nargs="+", help="fichiers, dossiers ou motifs glob")
+    parser.add_argument("--sortie", required=True, help="dossier des rapports et de la reprise")
+    parser.add_argument("--workers", type=int, default=None, help="processus de calcul (défaut: nombre de cœurs)")
+    parser.add_argument("--taille-chunk", type=int, default=TAILLE_CHUNK, help="formules par paquet")
+    parser.add_argument("--recommencer", action="store_true", help="ignorer la reprise et tout réanalyser")
+    parser.add_argument("--silencieux", action="store_true", help="ne pas afficher l'avancement")
+    args = parser.parse_args(argv)
+
+    fichiers = lister_fichiers(args.entrees)
+    if not fichiers:
+        parser.error("aucun fichier CSV / Excel trouvé")
+    journal = None if args.silencieux else (lambda message: print(message, file=sys.stderr, flush=True))
+    try:
+        reprise = analyser_fichiers(
+            fichiers, args.sortie, workers=args.workers, taille_chunk=args.taille_chunk,
+            recommencer=args.recommencer, journal=journal,
+        )
+    except KeyboardInterrupt:
+        print("Interrompu: relancer la même commande pour reprendre.", file=sys.stderr)
+        return 130
+    return 1 if any(etat["erreur"] for etat in reprise.fichiers.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Moteur de règles des schémas de scoring.
+
+Un schéma est une table ordonnée de règles (condition -> score,
+explication); la première règle satisfaite l'emporte. Les règles
+``contextuelles`` dépendent du caryotype (anomalies implicites, gains
+répétés) et sont réévaluées à chaque formule; les autres ne dépendent que
+de l'anomalie et ne sont évaluées qu'une fois par anomalie distincte.
+
+Chaque table est compilée une fois en un aiguillage par opérateur
+(Anomalie.operateur): seules les règles pouvant s'appliquer à un
+opérateur sont parcourues. Tous les schémas enregistrés sont évalués lors
+d'un même parcours des anomalies du caryotype (cf. scorer_anomalies).
+"""
+from collections import OrderedDict
+
+
+class Regle:
+    """
+    Règle d'un schéma de scoring.
+
+    - condition(tok, contexte) -> bool, ou None pour une règle par défaut
+    - explication : chaîne, ou fonction (tok, contexte) -> chaîne
+    - operateurs : opérateurs auxquels la règle est restreinte (None: tous)
+    - contextuelle : vrai si la condition dépend du caryotype
+    - prealable(contexte) -> bool : pour une règle contextuelle, test
+      évalué une fois par caryotype; s'il échoue, la règle est ignorée
+      pour toutes les anomalies du caryotype
+    """
+    __slots__ = ('nom', 'condition', 'score', 'explication', 'operateurs', 'contextuelle', 'prealable')
+
+    def __init__(self, nom, condition, score, explication, operateurs=None,
+                 contextuelle=False, prealable=None):
+        self.nom = nom
+        self.condition = condition
+        self.score = score
+        self.explication = explication
+        self.operateurs = frozenset(operateurs) if operateurs is not None else None
+        self.contextuelle = contextuelle
+        self.prealable = prealable
+
+    def expliquer(self, tok, contexte):
+        if callable(self.explication):
+            return self.explication(tok, contexte)
+        return self.explication
+
+    def __repr__(self):
+        return f"Regle({self.nom!r})"
+
+
+class Contexte:
+    """
+    Informations dépendant du caryotype, disponibles pour les règles
+    contextuelles.
+
+    - occurrences : {anomalie normalisée: nombre d'occurrences dans le caryotype}
+    - nb_anomalies : nombre d'anomalies du caryotype (répétitions incluses)
+    - implicites : {anomalie normalisée: {"reason", "ref"}}
+      (cf. detect_implicit_anomalies)
+    """
+    __slots__ = ('occurrences', 'nb_anomalies', 'implicites')
+
+    def __init__(self, occurrences, nb_anomalies, implicites):
+        self.occurrences = occurrences
+        self.nb_anomalies = nb_anomalies
+        self.implicites = implicites
+
+    def repetitions(self):
+        """Vrai si une anomalie normalisée apparaît plusieurs fois."""
+        return len(self.occurrences) < self.nb_anomalies
+
+
+class Schema:
+    """
+    Schéma de scoring: table de règles ordonnées, compilée en aiguillage
+    par opérateur. La table doit se terminer par une règle par défaut
+    (condition None) pour que toute anomalie reçoive un score.
+    """
+
+    def __init__(self, nom, regles):
+        self.nom = nom
+        self.regles = tuple(regles)
+        if not self.regles or self.regles[-1].condition is not None or self.regles[-1].contextuelle:
+            raise ValueError(f"Le schéma {nom!r} doit se terminer par une règle par défaut")
+        self._generiques = tuple(r for r in self.regles if r.operateurs is None)
+        self._aiguillage = {}
+        for regle in self.regles:
+            for op in regle.operateurs or ():
+                self._aiguillage.setdefault(op, None)
+        for op in self._aiguillage:
+            self._aiguillage[op] = tuple(
+                r for r in self.regles if r.operateurs is None or op in r.operateurs
+            )
+
+    def regles_pour(self, operateur):
+        """Règles applicables à ``operateur``, dans l'ordre de la table."""
+        return self._aiguillage.get(operateur, self._generiques)
+
+    def classer(self, tok):
+        """
+        Classement d'une anomalie indépendamment de son caryotype.
+        Renvoie (règles contextuelles à tester d'abord, score, explication
+        de la première règle non contextuelle satisfaite).
+        """
+        contextuelles = []
+        for regle in self.regles_pour(tok.operateur):
+            if regle.contextuelle:
+                contextuelles.append(regle)
+            elif regle.condition is None or regle.condition(tok, None):
+                return tuple(contextuelles), regle.score, regle.expliquer(tok, None)
+        raise AssertionError("règle par défaut manquante")
+
+    def __repr__(self):
+        return f"Schema({self.nom!r}, {len(self.regles)} règles)"
+
+
+def _explication_implicite(tok, contexte):
+    info = contexte.implicites[tok.norm]
+    return f"{info['reason']} ({info['ref']}) (0 point)"
+
+
+# Jondreville 2020 : 1 point par anomalie
+JONDREVILLE_2020 = Schema("Jondreville 2020", [
+    Regle("anomalie", None, 1, "Anomalie (1 point)"),
+])
+
+# ISCN 2024 : 0, 1 ou 2 points
+ISCN_2024 = Schema("ISCN 2024", [
+    # a) Constitutionnelles (+Nc) → 0 point quel que soit le contexte
+    Regle("constitutionnelle", lambda tok, ctx: tok.constitutionnelle,
+          0, "Anomalie constitutionnelle (0 point)", operateurs=('+',)),
+    # b) Anomalies implicites (dérivés, gains/pertes issus d'un dérivé)
+    Regle("implicite", lambda tok, ctx: tok.norm in ctx.implicites,
+          0, _explication_implicite, contextuelle=True,
+          prealable=lambda ctx: bool(ctx.implicites)),
+    # Tetrasomie: gain répété dans le caryotype
+    Regle("gain_repete", lambda tok, ctx: ctx.occurrences[tok.norm] > 1,
+          2, "Déséquilibre unichromosomique (2 points)", operateurs=('+',), contextuelle=True,
+          prealable=Contexte.repetitions),
+    # d) Chromosomes dicentriques → 2 points (hors gains/pertes)
+    Regle("dicentrique", lambda tok, ctx: tok.operateur not in ('+', '-') and tok.norm.startswith('dic'),
+          2, "Chromosome dicentrique (2 points)"),
+    # c) et e) Déséquilibres et translocations déséquilibrées → 2 points
+    Regle("unichromosomique", lambda tok, ctx: tok.unichr_deseq,
+          2, "Déséquilibre unichromosomique (2 points)"),
+    Regle("multichromosomique", lambda tok, ctx: tok.multichr_deseq,
+          2, "Déséquilibre multichromosomique complexe (2 points)"),
+    Regle("translocation_desequilibree", lambda tok, ctx: tok.translocation_desequilibree,
+          2, "Translocation déséquilibrée (2 points)"),
+    Regle("standard", None, 1, "Anomalie standard (1 point)"),
+])
+
+# Schémas de référence: toujours présents, en tête et dans cet ordre
+# (colonnes "Score Jondreville 2020" et "Score ISCN 2024")
+SCHEMAS_REFERENCE = (JONDREVILLE_2020, ISCN_2024)
+
+_SCHEMAS = OrderedDict((s.nom, s) for s in SCHEMAS_REFERENCE)
+
+
+def enregistrer_schema(schema):
+    """Ajoute (ou remplace) un schéma supplémentaire, par exemple propre au laboratoire."""
+    if any(schema.nom == s.nom for s in SCHEMAS_REFERENCE):
+        raise ValueError(f"Le schéma {schema.nom!r} est un schéma de référence")
+    _SCHEMAS[schema.nom] = schema
+    return schema
+
+
+def retirer_schema(nom):
+    """Retire un schéma supplémentaire."""
+    if any(nom == s.nom for s in SCHEMAS_REFERENCE):
+        raise ValueError(f"Le schéma {nom!r} est un schéma de référence")
+    _SCHEMAS.pop(nom, None)
+
+
+def schemas_enregistres():
+    """Schémas enregistrés, schémas de référence en tête."""
+    return tuple(_SCHEMAS.values())
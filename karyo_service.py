@@ -0,0 +1,327 @@
+"""
+Service HTTP local de scoring des formules caryotypiques (sans Streamlit).
+
+Serveur asyncio (bibliothèque standard uniquement): les requêtes sont
+traitées de manière asynchrone et le calcul est confié à un pool de
+processus. Le nombre de requêtes de scoring traitées simultanément et la
+file d'attente sont bornés: au-delà, le service répond 503 (Retry-After).
+
+Points d'entrée:
+- GET  /sante                      état du service et version des règles
+- POST /analyser                   {"formule": "..."} -> résultat JSON
+- GET  /analyser?formule=...       idem
+- POST /lot[?details=0]            JSON lines en entrée (une formule par
+                                   ligne: chaîne JSON ou {"formule", "id"}),
+                                   JSON lines en sortie, dans l'ordre
+                                   (details=0: totaux seuls, cf. compter_lot)
+
+Lancement:
+    python karyo_service.py --port 8600 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from My_expert_karyo_functions import ResultatLot, VERSION_REGLES, analyser_lot, compter_lot
+
+RAISONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    408: "Request Timeout", 411: "Length Required", 413: "Payload Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class ErreurHTTP(Exception):
+    def __init__(self, statut, message):
+        super().__init__(message)
+        self.statut = statut
+
+
+def resultat_formule(lot, i, formule, details=True):
+    """Résultat JSON-sérialisable de la i-ème formule d'un ResultatLot."""
+    resultat = {
+        "formule": formule,
+        "total_iscn": lot.totaux_iscn[i],
+        "total_jondreville": lot.totaux_jondreville[i],
+        "erreur": lot.erreurs[i],
+    }
+    if details:
+        resultat["anomalies"] = [ligne._asdict() for ligne in lot.anomalies(i)]
+    return resultat
+
+
+class ServiceScoring:
+    """
+    Service de scoring: ``workers`` processus de calcul, au plus
+    ``max_concurrence`` requêtes de scoring en cours et ``max_file`` en
+    attente; corps de requête limités à ``max_octets``.
+    """
+
+    def __init__(self, workers=None, max_concurrence=16, max_file=64,
+                 max_octets=50 * 1024 * 1024, taille_chunk=2000, delai=30.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_concurrence = max_concurrence
+        self.max_file = max_file
+        self.max_octets = max_octets
+        self.taille_chunk = taille_chunk
+        self.delai = delai
+        self._executor = None
+        self._semaphore = None
+        self._en_cours = 0
+
+    async def demarrer(self, host="127.0.0.1", port=8600):
+        """Démarre le serveur et renvoie l'objet asyncio.Server."""
+        # Processus créés à la demande, pendant le traitement d'une requête:
+        # pas de fork, qui leur ferait hériter des sockets des connexions
+        # ouvertes (fermeture d'une connexion "close" jamais vue du client)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver")
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrence)
+        return await asyncio.start_server(self._connexion, host, port)
+
+    def arreter(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    # Calcul
+    async def analyser(self, formules, details=True):
+        """
+        ResultatLot des ``formules``, calculé par paquets dans le pool
+        (totaux seuls, sans lignes d'anomalies, si ``details`` est faux).
+        """
+        loop = asyncio.get_running_loop()
+        fonction = analyser_lot if details else compter_lot
+        chunks = [formules[i:i + self.taille_chunk] for i in range(0, len(formules), self.taille_chunk)]
+        partiels = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, fonction, chunk) for chunk in chunks
+        ))
+        lot = ResultatLot()
+        for partiel in partiels:
+            lot.etendre(partiel)
+        return lot
+
+    async def _avec_limite(self, coroutine):
+        """Exécute ``coroutine`` sous la limite de concurrence (503 si file pleine)."""
+        if self._en_cours >= self.max_concurrence + self.max_file:
+            coroutine.close()
+            raise ErreurHTTP(503, "Service saturé, réessayer plus tard")
+        self._en_cours += 1
+        try:
+            async with self._semaphore:
+                return await coroutine
+        finally:
+            self._en_cours -= 1
+
+    # Points d'entrée
+    async def traiter(self, methode, cible, corps):
+        """Renvoie (statut, type de contenu, corps en octets)."""
+        url = urlsplit(cible)
+        params = parse_qs(url.query)
+
+        if url.path == "/sante":
+            if methode != "GET":
+                raise ErreurHTTP(405, "Méthode non autorisée")
+            return 200, "application/json", _json({
+                "statut": "ok",
+                "version_regles": VERSION_REGLES,
+                "workers": self.workers,
+                "en_cours": self._en_cours,
+            })
+
+        if url.path == "/analyser":
+            if methode == "GET":
+                formule = params.get("formule", [None])[0]
+            elif methode == "POST":
+                try:
+                    formule = json.loads(corps or b"{}").get("formule")
+                except (ValueError, AttributeError):
+                    raise ErreurHTTP(400, "Corps JSON invalide")
+            else:
+                raise ErreurHTTP(405, "Méthode non autorisée")
+            if not isinstance(formule, str):
+                raise ErreurHTTP(400, "Champ 'formule' manquant")
+            lot = await self._avec_limite(self.analyser([formule]))
+            return 200, "application/json", _json(resultat_formule(lot, 0, formule))
+
+        if url.path == "/lot":
+            if methode != "POST":
+                raise ErreurHTTP(405, "Méthode non autorisée")
+            details = params.get("details", ["1"])[0] not in ("0", "false")
+            entrees = _lire_json_lines(corps)
+            formules = [e["formule"] for e in entrees]
+            lot = await self._avec_limite(self.analyser(formules, details))
+            lignes = []
+            for i, entree in enumerate(entrees):
+                resultat = resultat_formule(lot, i, entree["formule"], details)
+                resultat["ligne"] = i + 1
+                if "id" in entree:
+                    resultat["id"] = entree["id"]
+                if entree.get("erreur"):
+                    resultat["erreur"] = entree["erreur"]
+                lignes.append(json.dumps(resultat, ensure_ascii=False))
+            corps_reponse = ("\n".join(lignes) + "\n").encode("utf-8") if lignes else b""
+            return 200, "application/x-ndjson", corps_reponse
+
+        raise ErreurHTTP(404, "Point d'entrée inconnu")
+
+    # HTTP/1.1 minimal (Content-Length, keep-alive)
+    async def _connexion(self, reader, writer):
+        try:
+            while True:
+                try:
+                    ligne = await asyncio.wait_for(reader.readline(), self.delai)
+                except asyncio.TimeoutError:
+                    break
+                if not ligne:
+                    break
+                try:
+                    methode, cible, version = ligne.decode("latin-1").split()
+                except ValueError:
+                    await self._repondre(writer, 400, _erreur("Requête invalide"), fermer=True)
+                    break
+
+                entetes = {}
+                while True:
+                    h = await asyncio.wait_for(reader.readline(), self.delai)
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    nom, _, valeur = h.decode("latin-1").partition(":")
+                    entetes[nom.strip().lower()] = valeur.strip()
+                fermer = (
+                    entetes.get("connection", "").lower() == "close"
+                    or (version == "HTTP/1.0" and entetes.get("connection", "").lower() != "keep-alive")
+                )
+
+                try:
+                    corps = await self._lire_corps(reader, methode, entetes)
+                except ErreurHTTP as e:
+                    # Corps non lu: la connexion ne peut pas être réutilisée
+                    await self._repondre(writer, e.statut, _erreur(str(e)), fermer=True)
+                    break
+                try:
+                    statut, type_contenu, reponse = await self.traiter(methode, cible, corps)
+                except ErreurHTTP as e:
+                    statut, type_contenu, reponse = e.statut, "application/json", _erreur(str(e))
+                except Exception as e:
+                    # Ex. BrokenProcessPool: réponse 500 plutôt que connexion coupée
+                    statut, type_contenu, reponse = 500, "application/json", _erreur(f"Erreur interne: {e}")
+                    fermer = True
+                await self._repondre(writer, statut, reponse, type_contenu, fermer)
+                if fermer:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def _lire_corps(self, reader, methode, entetes):
+        if methode != "POST":
+            return b""
+        if "content-length" not in entetes:
+            raise ErreurHTTP(411, "En-tête Content-Length requis")
+        taille = entetes["content-length"]
+        if not taille.isdecimal():
+            raise ErreurHTTP(400, "En-tête Content-Length invalide")
+        taille = int(taille)
+        if taille > self.max_octets:
+            raise ErreurHTTP(413, f"Corps limité à {self.max_octets} octets")
+        try:
+            return await asyncio.wait_for(reader.readexactly(taille), self.delai)
+        except asyncio.TimeoutError:
+            raise ErreurHTTP(408, "Délai de lecture dépassé")
+
+    async def _repondre(self, writer, statut, corps, type_contenu="application/json", fermer=False):
+        entetes = [
+            f"HTTP/1.1 {statut} {RAISONS.get(statut, '')}",
+            f"Content-Type: {type_contenu}; charset=utf-8",
+            f"Content-Length: {len(corps)}",
+            f"Connection: {'close' if fermer else 'keep-alive'}",
+        ]
+        if statut == 503:
+            entetes.append("Retry-After: 1")
+        writer.write(("\r\n".join(entetes) + "\r\n\r\n").encode("latin-1") + corps)
+        await writer.drain()
+
+
+def _json(donnees):
+    return json.dumps(donnees, ensure_ascii=False).encode("utf-8")
+
+
+def _erreur(message):
+    return _json({"erreur": message})
+
+
+def _lire_json_lines(corps):
+    """
+    Entrées d'un lot JSON lines: chaque ligne est une chaîne JSON ou un
+    objet {"formule": ..., "id": ...}. Une ligne invalide donne une entrée
+    en erreur (formule None) sans faire échouer le lot.
+    """
+    try:
+        texte = corps.decode("utf-8")
+    except UnicodeDecodeError:
+        raise ErreurHTTP(400, "Corps non encodé en UTF-8")
+    entrees = []
+    for ligne in texte.splitlines():
+        if not ligne.strip():
+            continue
+        try:
+            valeur = json.loads(ligne)
+        except ValueError:
+            entrees.append({"formule": None, "erreur": "Ligne JSON invalide"})
+            continue
+        if isinstance(valeur, str):
+            entrees.append({"formule": valeur})
+        elif isinstance(valeur, dict) and isinstance(valeur.get("formule"), str):
+            entree = {"formule": valeur["formule"]}
+            if "id" in valeur:
+                entree["id"] = valeur["id"]
+            entrees.append(entree)
+        else:
+            entrees.append({"formule": None, "erreur": "Champ 'formule' manquant"})
+    return entrees
+
+
+async def _servir(service, host, port):
+    serveur = await service.demarrer(host, port)
+    adresses = ", ".join(str(s.getsockname()) for s in serveur.sockets)
+    print(f"Service de scoring en écoute sur {adresses} ({service.workers} processus)")
+    try:
+        async with serveur:
+            await serveur.serve_forever()
+    finally:
+        service.arreter()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Service HTTP de scoring ISCN")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=None, help="processus de calcul (défaut: nombre de cœurs)")
+    parser.add_argument("--max-concurrence", type=int, default=16, help="requêtes de scoring simultanées")
+    parser.add_argument("--max-file", type=int, default=64, help="requêtes en attente avant de répondre 503")
+    parser.add_argument("--max-octets", type=int, default=50 * 1024 * 1024, help="taille maximale d'un corps")
+    parser.add_argument("--taille-chunk", type=int, default=2000, help="formules par tâche du pool")
+    args = parser.parse_args(argv)
+
+    service = ServiceScoring(
+        workers=args.workers,
+        max_concurrence=args.max_concurrence,
+        max_file=args.max_file,
+        max_octets=args.max_octets,
+        taille_chunk=args.taille_chunk,
+    )
+    try:
+        asyncio.run(_servir(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
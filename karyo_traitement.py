@@ -0,0 +1,262 @@
+"""
+Analyse d'un fichier en arrière-plan, par paquets.
+
+Un TraitementFichier lit et analyse le fichier dans un thread, paquet par
+paquet (cf. analyser_flux). Les résultats sont disponibles au fur et à
+mesure, avec la progression et le débit; l'annulation est prise en compte
+entre deux paquets. Indépendant de Streamlit: l'application se contente
+d'interroger l'état du traitement à chaque affichage.
+
+Un traitement peut partir d'un traitement précédent (même fichier
+rechargé après quelques corrections): les lignes sont comparées par
+empreinte (formule, comptage manuel), seules les formules inconnues du
+traitement précédent sont analysées et, pour un fichier du même nom,
+les modifications sont listées. Pour un autre fichier, seules les analyses
+des formules déjà connues sont reprises.
+"""
+import io
+import threading
+
+from karyo_colonnes import TableAnomalies
+from My_expert_karyo_functions import ResultatLot
+from karyo_flux import analyser_flux, cle_cellule, estimer_nb_lignes, lignes_resultats
+from karyo_instrumentation import INSTRUMENTATION, horloge
+
+# Paquets plus petits que pour l'écriture en flux: progression plus fluide
+TAILLE_PAQUET_SUIVI = 2000
+
+# Nature des modifications par rapport au traitement précédent
+LIGNE_ANALYSEE = "Formule nouvelle ou modifiée"
+LIGNE_REPRISE = "Ligne ajoutée ou comptage manuel modifié"
+LIGNE_DISPARUE = "Ligne supprimée ou modifiée"
+
+
+def _comptage(ligne):
+    return cle_cellule(ligne.get("Comptage manuel"))
+
+
+def positions_formules(results):
+    """{formule: position de sa première ligne} des lignes de résultats."""
+    positions = {}
+    for i in range(len(results) - 1, -1, -1):
+        positions[cle_cellule(results[i]["Formule"])] = i
+    return positions
+
+
+class Comparaison:
+    """
+    Comparaison des lignes d'un fichier avec celles d'un traitement
+    précédent, par empreinte (formule, comptage manuel). Chaque ligne
+    précédente ne peut correspondre qu'à une seule ligne du fichier
+    (formules répétées comprises).
+
+    - reference : (ResultatLot précédent, {formule: position}) pour analyser_flux
+    - modifications : lignes du fichier sans équivalent (LIGNE_ANALYSEE, ou
+      LIGNE_REPRISE si la formule était déjà analysée), puis lignes
+      précédentes sans équivalent (LIGNE_DISPARUE)
+    - nb_identiques, nb_reprises, nb_analysees
+    - complete : faux si le traitement précédent avait été interrompu (la
+      liste des modifications n'a alors pas de sens)
+    """
+
+    def __init__(self, results, lot, complete=True):
+        self.complete = complete
+        self.reference = (lot, positions_formules(results))
+        self._precedentes = results
+        # Empreinte -> positions précédentes non appariées (ordre inverse)
+        self._empreintes = {}
+        for i in range(len(results) - 1, -1, -1):
+            empreinte = (cle_cellule(results[i]["Formule"]), _comptage(results[i]))
+            self._empreintes.setdefault(empreinte, []).append(i)
+        self.modifications = []
+        self.nb_identiques = self.nb_reprises = self.nb_analysees = 0
+
+    def comparer(self, lignes):
+        """Apparie les lignes de résultats d'un paquet."""
+        positions = self.reference[1]
+        for ligne in lignes:
+            formule = cle_cellule(ligne["Formule"])
+            precedentes = self._empreintes.get((formule, _comptage(ligne)))
+            if precedentes:
+                precedentes.pop()
+                self.nb_identiques += 1
+                continue
+            if formule in positions:
+                self.nb_reprises += 1
+                nature = LIGNE_REPRISE
+            else:
+                self.nb_analysees += 1
+                nature = LIGNE_ANALYSEE
+            self.modifications.append(self._modification(ligne, nature))
+
+    def terminer(self, disparues=True):
+        """
+        Fin de la comparaison: ajoute (sauf lecture interrompue) les lignes
+        précédentes restées sans équivalent et libère les résultats précédents.
+        """
+        if disparues:
+            restantes = sorted(i for positions in self._empreintes.values() for i in positions)
+            self.modifications.extend(
+                self._modification(self._precedentes[i], LIGNE_DISPARUE) for i in restantes
+            )
+        self.reference = self._empreintes = self._precedentes = None
+
+    @property
+    def nb_disparues(self):
+        return sum(m["Modification"] == LIGNE_DISPARUE for m in self.modifications)
+
+    @staticmethod
+    def _modification(ligne, nature):
+        return {
+            "Modification": nature,
+            "Ligne": ligne["Ligne"],
+            "Formule": ligne["Formule"],
+            "Comptage manuel": ligne.get("Comptage manuel"),
+        }
+
+
+class TraitementFichier:
+    """
+    Traitement en arrière-plan d'un fichier chargé (contenu brut + nom).
+
+    - results : lignes de résultats (cf. lignes_resultats)
+    - details : {"error", "lignes"|"message"} par formule
+    - table : TableAnomalies du fichier
+    - lot : ResultatLot de toutes les formules lues
+    - erreur : exception ayant interrompu la lecture, ou None
+    - cle : identifiant libre du traitement (ex. empreinte du contenu)
+    - comparaison : Comparaison avec le traitement ``precedent`` s'il porte
+      sur un fichier du même nom, ou None (analyses du ``precedent`` reprises
+      sans comparaison pour un autre fichier)
+    """
+
+    def __init__(self, contenu, nom, workers=1, taille_chunk=TAILLE_PAQUET_SUIVI, cle=None,
+                 precedent=None):
+        self.cle = cle
+        self.nom = nom
+        self.workers = workers
+        self.taille_chunk = taille_chunk
+        self.results = []
+        self.details = []
+        self.table = TableAnomalies()
+        self.lot = ResultatLot()
+        self.comparaison = None
+        self.has_count = False
+        self.nb_paquets = 0
+        self.nb_lignes_estime = None
+        self.erreur = None
+        self.debut = self.fin = None
+        self._contenu = contenu
+        self._precedent = precedent
+        self._annulation = threading.Event()
+        self._termine = threading.Event()
+        self._verrou = threading.Lock()
+        self._thread = None
+
+    def _source(self):
+        source = io.BytesIO(self._contenu)
+        source.name = self.nom
+        return source
+
+    def demarrer(self):
+        """Lance le traitement dans un thread (démon)."""
+        self.debut = horloge()
+        self._thread = threading.Thread(target=self._executer, name=f"analyse-{self.nom}", daemon=True)
+        self._thread.start()
+        return self
+
+    def annuler(self):
+        """Demande l'arrêt du traitement (pris en compte au paquet suivant)."""
+        self._annulation.set()
+
+    def annule(self):
+        return self._annulation.is_set()
+
+    def termine(self):
+        """Vrai si le traitement est fini (complet, annulé ou en erreur)."""
+        return self._termine.is_set()
+
+    def complet(self):
+        """Vrai si toutes les lignes ont été analysées."""
+        return self.termine() and not self.annule() and self.erreur is None
+
+    def attendre(self, delai=None):
+        """Attend la fin du traitement (au plus ``delai`` secondes)."""
+        return self._termine.wait(delai)
+
+    @property
+    def nb_traitees(self):
+        return len(self.results)
+
+    def progression(self):
+        """Avancement entre 0 et 1 (estimé d'après le nombre de lignes du fichier)."""
+        if self.complet():
+            return 1.0
+        if not self.nb_lignes_estime:
+            return 0.0
+        return min(self.nb_traitees / self.nb_lignes_estime, 1.0)
+
+    def duree(self):
+        if self.debut is None:
+            return 0.0
+        return (self.fin if self.fin is not None else horloge()) - self.debut
+
+    def debit(self):
+        """Lignes analysées par seconde."""
+        duree = self.duree()
+        return self.nb_traitees / duree if duree else 0.0
+
+    def instantane(self):
+        """(results, details, has_count) cohérents à l'instant de l'appel."""
+        with self._verrou:
+            n = len(self.results)
+            return self.results[:n], self.details[:n], self.has_count
+
+    def _executer(self):
+        try:
+            self.nb_lignes_estime = estimer_nb_lignes(self._source())
+            reference = None
+            if self._precedent is not None:
+                # Résultats (éventuellement partiels) du traitement remplacé
+                self._precedent.attendre()
+                results, _, _ = self._precedent.instantane()
+                if self._precedent.nom == self.nom:
+                    self.comparaison = Comparaison(results, self._precedent.lot, self._precedent.complet())
+                    reference = self.comparaison.reference
+                else:
+                    reference = (self._precedent.lot, positions_formules(results))
+                self._precedent = None
+            paquets = analyser_flux(
+                self._source(), workers=self.workers, taille_chunk=self.taille_chunk, reference=reference,
+            )
+            try:
+                for debut, formules, counts, lot in paquets:
+                    lignes = list(lignes_resultats(formules, counts, lot, debut))
+                    details = [
+                        {"error": True, "message": error} if error
+                        else {"error": False, "lignes": lot.anomalies(i)}
+                        for i, error in enumerate(lot.erreurs)
+                    ]
+                    with self._verrou:
+                        self.has_count = counts is not None
+                        self.table.ajouter_lot(lot, debut, formules)
+                        self.lot.etendre(lot)
+                        self.details.extend(details)
+                        self.results.extend(lignes)
+                        self.nb_paquets += 1
+                        if self.comparaison is not None:
+                            self.comparaison.comparer(lignes)
+                    if self._annulation.is_set():
+                        break
+            finally:
+                paquets.close()
+            if self.comparaison is not None:
+                self.comparaison.terminer(disparues=not self._annulation.is_set())
+        except Exception as e:
+            self.erreur = e
+        finally:
+            self.fin = horloge()
+            self._contenu = self._precedent = None
+            if INSTRUMENTATION.actif:
+                INSTRUMENTATION.ajouter("fichier", self.fin - self.debut, self.nb_traitees)
+            self._termine.set()
@@ -0,0 +1,274 @@
+"""
+Lecture en flux de colonnes choisies d'un classeur Excel (.xlsx).
+
+openpyxl, même en lecture seule, construit une cellule pour chaque colonne
+de chaque ligne: sur des exports larges (dizaines de colonnes de
+métadonnées), l'essentiel du temps part dans des colonnes ignorées. Ici la
+première feuille est parcourue avec expat (bibliothèque standard), par
+blocs, et seules les cellules des colonnes choisies d'après l'en-tête sont
+décodées. Les valeurs sont celles d'openpyxl en mode data_only (texte,
+entier ou décimal, booléen); les styles (dates) ne sont pas interprétés.
+"""
+import posixpath
+import zipfile
+from xml.etree import ElementTree
+from xml.parsers import expat
+
+# Taille des blocs décompressés transmis à expat
+TAILLE_BLOC = 1 << 20
+
+_REL_DOCUMENT = "/officeDocument"
+_REL_FEUILLE = "/worksheet"
+_REL_CHAINES = "/sharedStrings"
+
+
+def _local(nom):
+    """Nom local d'une balise ("{uri}c" -> "c")."""
+    return nom.rpartition('}')[2]
+
+
+def _relations(archive, chemin):
+    """{Id: (type, cible)} des relations de la partie ``chemin``."""
+    dossier, nom = posixpath.split(chemin)
+    rels = posixpath.join(dossier, "_rels", nom + ".rels")
+    if rels not in archive.namelist():
+        return {}
+    relations = {}
+    for rel in ElementTree.fromstring(archive.read(rels)):
+        cible = rel.get("Target", "")
+        # Cible absolue dans le paquet, ou relative au dossier de la partie
+        cible = cible.lstrip("/") if cible.startswith("/") else posixpath.normpath(posixpath.join(dossier, cible))
+        relations[rel.get("Id")] = (rel.get("Type", ""), cible)
+    return relations
+
+
+def _parties(archive):
+    """Chemins de la première feuille de calcul et de la table des chaînes partagées."""
+    classeur = next(
+        (cible for type_, cible in _relations(archive, "").values() if type_.endswith(_REL_DOCUMENT)),
+        "xl/workbook.xml",
+    )
+    relations = _relations(archive, classeur)
+    feuille = None
+    for element in ElementTree.fromstring(archive.read(classeur)).iter():
+        if _local(element.tag) != "sheet":
+            continue
+        rid = next((v for k, v in element.attrib.items() if _local(k) == "id"), None)
+        type_, cible = relations.get(rid, ("", None))
+        if type_.endswith(_REL_FEUILLE):
+            feuille = cible
+            break
+    if feuille is None:
+        raise ValueError("Le classeur ne contient aucune feuille de calcul.")
+    chaines = next((cible for type_, cible in relations.values() if type_.endswith(_REL_CHAINES)), None)
+    return feuille, chaines
+
+
+def _chaines_partagees(archive, chemin):
+    """Table des chaînes partagées (texte des runs, sans les annotations phonétiques)."""
+    if chemin is None or chemin not in archive.namelist():
+        return []
+    chaines = []
+    with archive.open(chemin) as f:
+        for _, element in ElementTree.iterparse(f):
+            if _local(element.tag) != "si":
+                continue
+            morceaux = []
+            for enfant in element:
+                nom = _local(enfant.tag)
+                if nom == "t":
+                    morceaux.append(enfant.text or "")
+                elif nom == "r":
+                    morceaux.extend(t.text or "" for t in enfant if _local(t.tag) == "t")
+            chaines.append("".join(morceaux))
+            element.clear()
+    return chaines
+
+
+def _valeur(type_, texte, chaines):
+    """Valeur d'une cellule d'après son type (attribut t) et son texte."""
+    if type_ == "s":
+        return chaines[int(texte)] if texte else None
+    if type_ in ("inlineStr", "str", "e"):
+        return texte
+    if not texte:
+        return None
+    if type_ == "b":
+        return texte == "1"
+    if type_ == "n":
+        if "." in texte or "E" in texte or "e" in texte:
+            return float(texte)
+        return int(texte)
+    return texte
+
+
+class _FinEntete(Exception):
+    pass
+
+
+def derniere_ligne_xlsx(source):
+    """
+    Numéro de la dernière ligne de la première feuille d'après sa dimension
+    déclarée (<dimension ref="A1:K2000"/>), lue en début de feuille sans
+    parcourir les données; None si elle n'est pas déclarée.
+    """
+    derniere = None
+
+    def debut(nom, attributs):
+        nonlocal derniere
+        nom = nom[nom.find(":") + 1:]
+        if nom == "dimension":
+            fin = attributs.get("ref", "").rpartition(":")[2].lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ$")
+            derniere = int(fin) if fin.isdecimal() else None
+            raise _FinEntete()
+        if nom == "sheetData":
+            raise _FinEntete()
+
+    with zipfile.ZipFile(source) as archive:
+        feuille, _ = _parties(archive)
+        parseur = expat.ParserCreate()
+        parseur.StartElementHandler = debut
+        with archive.open(feuille) as f:
+            try:
+                while True:
+                    bloc = f.read(1 << 14)
+                    parseur.Parse(bloc, not bloc)
+                    if not bloc:
+                        break
+            except _FinEntete:
+                pass
+    return derniere
+
+
+def lire_colonnes_xlsx(source, selectionner, taille_bloc=TAILLE_BLOC):
+    """
+    Générateur des lignes de données de la première feuille, réduites aux
+    colonnes choisies.
+
+    ``selectionner(entete)`` reçoit les valeurs de la ligne 1 de la feuille
+    (tuple, vide si elle est absente) et renvoie les indices (à partir de 0)
+    des colonnes à lire; chaque ligne suivante est rendue sous forme de
+    tuple des valeurs de ces colonnes, dans cet ordre (None pour une
+    cellule vide), y compris les lignes dont seules d'autres colonnes sont
+    remplies. Comme avec pandas (openpyxl), les lignes absentes du XML de
+    la feuille (d'après l'attribut r des lignes) sont rendues vides, et
+    les lignes vides en fin de feuille (aucune valeur dans aucune colonne)
+    ne sont pas rendues: la n-ième ligne rendue est la ligne n + 1.
+    """
+    with zipfile.ZipFile(source) as archive:
+        feuille, chemin_chaines = _parties(archive)
+        chaines = _chaines_partagees(archive, chemin_chaines)
+
+        ordre = None        # colonnes choisies, dans l'ordre demandé
+        retenues = None     # ensemble des colonnes lues (None: en-tête, toutes)
+        numero = 0          # numéro de la ligne courante
+        dernier = 1         # numéro de la dernière ligne traitée (1: en-tête)
+        colonne = -1        # colonne de la dernière cellule (références absentes)
+        valeurs = {}        # colonne -> valeur, pour la ligne courante
+        remplie = False     # valeur dans une colonne quelconque de la ligne courante
+        vides = 0           # lignes vides en attente (rendues si une ligne remplie suit)
+        cellule = -1        # colonne de la cellule en cours de lecture (-1: ignorée)
+        type_cellule = "n"
+        morceaux = None     # texte de la cellule en cours (<v> ou <t>)
+        capture = False     # dans un <v> / <t> d'une cellule lue
+        phonetique = False  # dans une annotation <rPh> (ignorée)
+        pretes = []         # lignes complètes, pas encore rendues
+        indices = {}        # lettres de colonne -> indice
+        # Noms des balises, éventuellement préfixés ("x:c"): fixés sur la racine
+        C = V = T = ROW = RPH = None
+
+        def indice(reference):
+            lettres = reference.rstrip("0123456789")
+            i = indices.get(lettres)
+            if i is None:
+                i = 0
+                for c in lettres:
+                    i = i * 26 + ord(c) - 64
+                i = indices[lettres] = i - 1
+            return i
+
+        def racine(nom, attributs):
+            nonlocal C, V, T, ROW, RPH
+            prefixe = nom[:nom.index(":") + 1] if ":" in nom else ""
+            C, V, T, ROW, RPH = (prefixe + n for n in ("c", "v", "t", "row", "rPh"))
+            parseur.StartElementHandler = debut
+
+        def debut(nom, attributs):
+            nonlocal numero, colonne, valeurs, remplie, cellule, type_cellule, morceaux, capture, phonetique
+            if nom == C:
+                reference = attributs.get("r")
+                colonne = indice(reference) if reference else colonne + 1
+                if retenues is None or colonne in retenues:
+                    cellule = colonne
+                    type_cellule = attributs.get("t", "n")
+                else:
+                    cellule = -1
+            elif (nom == V or nom == T) and not phonetique:
+                remplie = True
+                if cellule >= 0:
+                    # Texte enrichi: plusieurs <t> concaténés
+                    if morceaux is None:
+                        morceaux = []
+                    capture = True
+            elif nom == ROW:
+                reference = attributs.get("r")
+                numero = int(reference) if reference else numero + 1
+                colonne = -1
+                valeurs = {}
+                remplie = False
+            elif nom == RPH:
+                phonetique = True
+
+        def fin(nom):
+            nonlocal cellule, morceaux, capture, phonetique, ordre, retenues, vides, dernier
+            if nom == C:
+                if cellule >= 0 and morceaux is not None:
+                    valeurs[cellule] = _valeur(type_cellule, "".join(morceaux), chaines)
+                cellule = -1
+                morceaux = None
+            elif nom == V or nom == T:
+                capture = False
+            elif nom == ROW:
+                if ordre is None:
+                    # En-tête: ligne 1 de la feuille
+                    if numero == 1:
+                        entete = tuple(valeurs.get(i) for i in range(max(valeurs, default=-1) + 1))
+                    else:
+                        entete = ()
+                    ordre = list(selectionner(entete))
+                    retenues = frozenset(ordre)
+                    if numero == 1:
+                        return
+                # Lignes absentes du XML depuis la précédente: vides
+                vides += max(numero - dernier - 1, 0)
+                dernier = numero
+                if not remplie:
+                    vides += 1
+                    return
+                if vides:
+                    pretes.extend([(None,) * len(ordre)] * vides)
+                    vides = 0
+                pretes.append(tuple(valeurs.get(i) for i in ordre))
+            elif nom == RPH:
+                phonetique = False
+
+        def texte(contenu):
+            if capture:
+                morceaux.append(contenu)
+
+        parseur = expat.ParserCreate()
+        parseur.buffer_text = True
+        parseur.StartElementHandler = racine
+        parseur.EndElementHandler = fin
+        parseur.CharacterDataHandler = texte
+        with archive.open(feuille) as f:
+            while True:
+                bloc = f.read(taille_bloc)
+                parseur.Parse(bloc, not bloc)
+                yield from pretes
+                pretes.clear()
+                if not bloc:
+                    break
+        if ordre is None:
+            # Feuille sans aucune ligne
+            selectionner(())